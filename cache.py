@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+# 训练结果缓存: 同一 (A, b, ansatz, 超参) 不重复训练
+# entries are content-addressed .npz files, file mtime doubles as the LRU clock
+
+import os
+import json
+import hashlib
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+from numpy import ndarray
+
+from utils import LOG_PATH
+
+RESULT_PATH = LOG_PATH / 'results'
+
+Entry = Dict[str, Any]
+
+
+def result_key(A:ndarray, b:ndarray, **hparams:Any) -> str:
+  ''' sha1 over the content of (A, b) and the hparams (ansatz type, depth, optimizer settings, ...) '''
+  hasher = hashlib.sha1()
+  for arr in [A, b]:
+    arr = np.ascontiguousarray(arr)
+    hasher.update(str((arr.shape, arr.dtype.str)).encode())
+    hasher.update(arr.tobytes())
+  hasher.update(json.dumps(hparams, sort_keys=True, default=str).encode())
+  return hasher.hexdigest()
+
+
+class ResultCache:
+
+  '''
+  Persistent cache of trained solutions: optimal params, final loss, fidelity, the ansatz state and the exported QASM.
+  Bounded by max_entries and max_bytes, the least recently used entries are evicted first.
+  '''
+
+  def __init__(self, root:Path=RESULT_PATH, max_entries:int=1000, max_bytes:int=2**30):
+    self.root = Path(root)
+    self.root.mkdir(parents=True, exist_ok=True)
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+
+  def _fp(self, key:str) -> Path:
+    return self.root / f'{key}.npz'
+
+  def __contains__(self, key:str) -> bool:
+    return self._fp(key).exists()
+
+  def get(self, key:str) -> Optional[Entry]:
+    fp = self._fp(key)
+    if not fp.exists(): return None
+    os.utime(fp)    # mark as recently used
+    with np.load(fp) as data:
+      entry = {k: data[k] for k in data.files}
+    for k in ['loss', 'fid', 'qasm']:
+      if k in entry: entry[k] = entry[k].item()
+    return entry
+
+  def put(self, key:str, param:ndarray, loss:float, fid:float=None, state:ndarray=None, qasm:str=None):
+    entry = {'param': np.asarray(param), 'loss': np.asarray(loss)}
+    if fid   is not None: entry['fid']   = np.asarray(fid)
+    if state is not None: entry['state'] = np.asarray(state)
+    if qasm  is not None: entry['qasm']  = np.asarray(qasm)
+    fp = self._fp(key)
+    tmp_fp = fp.with_suffix('.tmp.npz')
+    np.savez(tmp_fp, **entry)
+    os.replace(tmp_fp, fp)
+    self.evict()
+
+  def evict(self):
+    ''' drop least recently used entries until both bounds hold '''
+    fps = sorted(self.root.glob('*.npz'), key=lambda fp: fp.stat().st_mtime)
+    sizes = [fp.stat().st_size for fp in fps]
+    n_entries, n_bytes = len(fps), sum(sizes)
+    for fp, size in zip(fps, sizes):
+      if n_entries <= self.max_entries and n_bytes <= self.max_bytes: break
+      fp.unlink(missing_ok=True)
+      n_entries -= 1
+      n_bytes -= size
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+
+# 采样解码: 由测量频率还原 x，postprocess() 除以缩放指示位 x_tilde[-1]，它的采样噪声会放大到所有分量上
+# with counts c over N shots, the decoded x_hat_i = sqrt(c_i / c_I) (I the indicator basis state), and the delta method on
+# the multinomial gives Var[log c_i] ≈ (1-p_i)/(N p_i), Cov[log c_i, log c_I] ≈ -1/N, hence
+#   Var[x_hat_i] ≈ x_i^2 (1/p_i + 1/p_I) / (4N) = (1 + x_i^2) / (4 N p_I)
+# i.e. every component shares the 1/(N p_I) of the indicator, and the expected L1 error is sqrt(2/π) mean_i std[x_hat_i]
+
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+from numpy import ndarray
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from utils import fwht
+from simulator import apply_cnot, apply_ry
+
+
+''' Indicator Precision '''
+
+def decode_counts(counts:ndarray, n:int=None) -> ndarray:
+  ''' x_hat [n] from the counts [2^k] of the ansatz state, same as postprocess(sqrt(probs)); n defaults to all but the indicator '''
+  counts = np.asarray(counts, dtype=np.float64)
+  n = n or len(counts) - 1
+  return np.sqrt(counts[:n] / counts[-1])
+
+def decode_var(probs:ndarray, n_shots:int, n:int=None) -> ndarray:
+  ''' the delta-method variance [n] of decode_counts() over n_shots, probs [2^k] are the (estimated) basis probabilities '''
+  probs = np.asarray(probs, dtype=np.float64)
+  n = n or len(probs) - 1
+  return (1 + probs[:n] / probs[-1]) / (4 * n_shots * probs[-1])
+
+def expected_l1(probs:ndarray, n_shots:int, n:int=None) -> float:
+  ''' the expected mean absolute error of decode_counts() over n_shots '''
+  return np.sqrt(2 / np.pi) * np.sqrt(decode_var(probs, n_shots, n)).mean()
+
+def shots_for_l1(probs:ndarray, l1:float, n:int=None) -> int:
+  ''' the least n_shots s.t. expected_l1() <= l1, it scales as 1 / (p_I l1^2) '''
+  return int(np.ceil((expected_l1(probs, 1, n) / l1)**2))
+
+def sample_to_l1(sample_fn:Callable[[int], ndarray], l1:float, n:int=None, n_pilot:int=1000, max_shots:int=10**8, max_growth:float=4.0) -> Tuple[ndarray, ndarray]:
+  '''
+  sample only as much as the indicator needs: starting from a pilot round, keep adding shots until the expected L1
+  error at the plug-in probabilities meets l1 (or max_shots is spent); the shots grow at most max_growth times a round,
+  since the early plug-in p_I rests on a handful of counts, and an unseen indicator just grows them
+    sample_fn: n_shots => counts [2^k]
+  return x_hat [n] and the pooled counts [2^k]
+  '''
+  counts = np.asarray(sample_fn(n_pilot), dtype=np.int64)
+  while counts.sum() < max_shots:
+    n_done = counts.sum()
+    n_need = shots_for_l1(counts / n_done, l1, n) if counts[-1] else np.inf
+    if n_done >= n_need: break
+    n_next = min(n_need, max_growth * n_done, max_shots)
+    counts = counts + sample_fn(int(n_next - n_done))
+  return decode_counts(counts, n), counts
+
+
+''' Sign Recovery '''
+# |x> is real (up to a global phase), the computational basis gives |x_k| only; for an XOR pattern d, the circuit
+#   CNOT(w -> v) for the other qubits v of d, then RY(-π/2) on w    (w the pivot qubit of d)
+# maps each pair (k, k^d) with bit w of k being 0 onto (k, k^w), and P(k) - P(k^w) = 2 x_k x_{k^d},
+# so ONE circuit tells the relative sign of EVERY pair differing by d; a few patterns connect the whole support
+
+def pivot_bit(d:int) -> int:
+  ''' the lowest set bit of d as a mask '''
+  return d & -d
+
+def xor_corr(f:ndarray) -> ndarray:
+  ''' XOR autocorrelation [2^n] of f [2^n], c[d] = Σ_k f[k] f[k^d], by two Walsh-Hadamard transforms '''
+  F = fwht(np.array(f, dtype=np.float64))
+  return fwht(F * F) / len(F)
+
+def sign_patterns(support:ndarray) -> List[int]:
+  '''
+  greedily pick XOR patterns until the pairs (k, k^d) they cover connect the support (a spanning forest),
+  each round takes the pattern that covers the most pairs across components, so at most |S|-1 and often ~log|S| circuits;
+  the pair counts of all d at once are the xor_corr() of the support minus those within each component, the latter by
+  xor_corr() for large components and by their explicit pairs for small ones, O(N log N) a round in either case
+  '''
+  support = np.unique(np.asarray(support, dtype=np.int64))
+  m = len(support)
+  if m < 2: return []
+  N = 2**int(support[-1]).bit_length()
+  on = np.zeros(N) ; on[support] = 1
+  pairs_all = xor_corr(on)
+  big = int(np.sqrt(N * np.log2(N)))   # xor_corr() vs. the s^2 explicit pairs of a component of size s
+
+  patterns: List[int] = []
+  comp = np.arange(m)     # component label of each support state
+  n_comp = m
+  while n_comp > 1:
+    order = np.argsort(comp, kind='stable')
+    _, starts, sizes = np.unique(comp[order], return_index=True, return_counts=True)
+    pairs_in = np.zeros(N)
+    small: List[ndarray] = []
+    for st, sz in zip(starts, sizes):
+      if sz == 1: continue
+      members = support[order[st:st+sz]]
+      if sz > big:
+        f = np.zeros(N) ; f[members] = 1
+        pairs_in += xor_corr(f)
+      else:
+        small.append((members[:, None] ^ members[None, :]).ravel())
+    if small: pairs_in += np.bincount(np.concatenate(small), minlength=N)
+    gain = np.rint(pairs_all - pairs_in)   # ordered pairs, 2x the count, not merges, a cheap and good enough proxy
+    gain[0] = 0
+    best = int(np.argmax(gain))
+    patterns.append(best)
+
+    i = np.flatnonzero(on[support ^ best])
+    j = np.searchsorted(support, support[i] ^ best)
+    graph = coo_matrix((np.ones(len(i)), (comp[i], comp[j])), shape=(m, m))
+    _, labels = connected_components(graph, directed=False)
+    comp = labels[comp]
+    n_comp = len(np.unique(comp))
+  return patterns
+
+def apply_interference(psi:ndarray, d:int, nq:int) -> ndarray:
+  ''' the interference circuit of pattern d on a state [2^n] on the native simulator '''
+  out = np.array(psi, dtype=np.result_type(psi, np.float64))[None, :]
+  w = nq - 1 - int(np.log2(pivot_bit(d)))
+  for v in range(nq):
+    if v != w and d >> (nq - 1 - v) & 1: apply_cnot(out, nq, w, v)
+  apply_ry(out, nq, w, np.asarray([-np.pi / 2]))
+  return out[0]
+
+def qml_interference(d:int, nq:int) -> list:
+  ''' the same circuit as apply_interference() as PennyLane ops, call it inside a QNode right before measuring '''
+  import pennylane as qml
+  w = nq - 1 - int(np.log2(pivot_bit(d)))
+  ops = [qml.CNOT(wires=[w, v]) for v in range(nq) if v != w and d >> (nq - 1 - v) & 1]
+  ops.append(qml.RY(-np.pi / 2, wires=w))
+  return ops
+
+def pair_products(counts:ndarray, d:int) -> ndarray:
+  ''' estimates [2^n] of x_k x_{k^d} from the counts of the pattern-d circuit, valid at k with the pivot bit 0 '''
+  counts = np.asarray(counts, dtype=np.float64)
+  k = np.arange(len(counts))
+  return (counts - counts[k ^ pivot_bit(d)]) / (2 * counts.sum())
+
+def recover_signs(probs:ndarray, support:ndarray, patterns:List[int], counts_list:List[ndarray]) -> ndarray:
+  '''
+  signs [2^n] (+1 at the largest amplitude, 0 off the support) from the pattern circuits: the relative signs are
+  chained along a maximum-weight spanning tree, weighted by the estimated |x_i x_j|, so every sign rests on the most
+  reliable pairs; the measured products are used, not the sign of noise around 0
+  '''
+  support = set(np.asarray(support).tolist())
+  edges: List[Tuple[float, int, int, int]] = []    # (|x_i x_j|, i, j, sign)
+  for d, counts in zip(patterns, counts_list):
+    prods = pair_products(counts, d)
+    for i in support:
+      j = i ^ d
+      if i & pivot_bit(d) or j not in support: continue
+      edges.append((abs(prods[i]), i, j, 1 if prods[i] >= 0 else -1))
+
+  adj: Dict[int, List[Tuple[int, int]]] = {k: [] for k in support}
+  parent = {k: k for k in support}
+
+  def find(k:int) -> int:
+    while parent[k] != k:
+      parent[k] = parent[parent[k]]
+      k = parent[k]
+    return k
+
+  for _, i, j, s in sorted(edges, reverse=True):    # Kruskal
+    if find(i) == find(j): continue
+    parent[find(i)] = find(j)
+    adj[i].append((j, s))
+    adj[j].append((i, s))
+
+  signs = np.zeros(len(probs), dtype=np.int64)
+  root = max(support, key=lambda k: probs[k])
+  signs[root] = 1
+  stack = [root]
+  while stack:
+    i = stack.pop()
+    for j, s in adj[i]:
+      if signs[j] == 0:
+        signs[j] = signs[i] * s
+        stack.append(j)
+  return signs
+
+def sample_signed(sample_fn:Callable[[int], ndarray], interfere_fn:Callable[[int, int], ndarray], n_shots:int, thresh:float=None) -> Tuple[ndarray, int]:
+  '''
+  real amplitudes [2^n] with signs from shots: |x_k| = sqrt(freq) from the computational basis, signs from the pattern
+  circuits over the support {k: freq_k > thresh}, n_shots for each circuit (thresh defaults to 3 counts)
+    sample_fn: n_shots => counts [2^n]
+    interfere_fn: (d, n_shots) => counts [2^n] of the pattern-d circuit
+  return the signed amplitudes and the number of pattern circuits
+  '''
+  counts = np.asarray(sample_fn(n_shots))
+  probs = counts / counts.sum()
+  thresh = 3 / n_shots if thresh is None else thresh
+  support = np.flatnonzero(probs > thresh)
+  patterns = sign_patterns(support)
+  signs = recover_signs(probs, support, patterns, [interfere_fn(d, n_shots) for d in patterns])
+  return signs * np.sqrt(probs), len(patterns)
+
+if __name__ == '__main__':
+  from utils import preprocess, sample_state
+
+  A, b, x = preprocess()
+  xv = np.asarray([12, 5, 3])
+  probs = np.abs(x.flatten())**2
+  rng = np.random.default_rng(42)
+
+  # the delta method vs. the empirical variance over repeated runs
+  n_shots = 100000
+  runs = np.stack([decode_counts(sample_state(x, n_shots, rng)) for _ in range(2000)])
+  print(f'[{n_shots} shots] p_I = {probs[-1]:.4f}')
+  print('  std (delta method):', np.sqrt(decode_var(probs, n_shots)))
+  print('  std (empirical):   ', runs.std(axis=0))
+  print(f'  L1 err expected: {expected_l1(probs, n_shots):.5f}, empirical: {np.abs(runs - xv).mean():.5f}')
+
+  # just enough shots for a target error, instead of a fixed 100000
+  for l1 in [0.2, 0.05, 0.01]:
+    errs, shots = [], []
+    for _ in range(200):
+      x_hat, counts = sample_to_l1(lambda k: sample_state(x, k, rng), l1)
+      errs.append(np.abs(x_hat - xv).mean())
+      shots.append(counts.sum())
+    print(f'[target L1 {l1}] shots: {shots_for_l1(probs, l1)} (exact probs), {int(np.mean(shots))} (sampled), L1 err: {np.mean(errs):.4f}')
+
+  # signs of a general real solution: a random system with mixed-sign x on 4 qubits
+  nq = 4
+  xs = rng.normal(size=[2**nq]) * (rng.uniform(size=[2**nq]) < 0.75)
+  psi = xs / np.linalg.norm(xs)
+  n_shots = 100000
+  x_abs = np.sqrt(sample_state(psi, n_shots, rng) / n_shots)
+  x_sgn, n_circ = sample_signed(lambda k: sample_state(psi, k, rng), lambda d, k: sample_state(apply_interference(psi, d, nq), k, rng), n_shots)
+  print(f'[{nq} qubits, support {np.count_nonzero(psi)}] {n_circ} extra circuits')
+  print(f'  fid sqrt(probs): {np.abs(x_abs @ psi)**2:.6f}, with signs: {np.abs(x_sgn @ psi)**2:.6f}')
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+
+# submit_ising.ipynb 的数值版: 方程 -> QUBO -> Ising，不经 sympy，也不构造稠密哈密顿量
+# each x_i = low_i + Σ_k 2^k b_ik is binary-encoded (bits are MSB first per variable, qubit order = bit order), then
+#   f(bits) = ||A x - b||^2 / 2 = bits^T Q bits + q^T bits + c                              (QUBO)
+#           = offset + Σ_i h_i z_i + Σ_{i<j} J_ij z_i z_j,  with bit_i = (1 - z_i) / 2      (Ising)
+# everything is closed-form in A^T A and A^T b, so 30~60 bits cost nothing, and H = diag(f) is never materialized
+
+from typing import Callable, List, Tuple
+
+import numpy as np
+from numpy import ndarray
+
+Ising = Tuple[ndarray, ndarray, float]    # h [n], J [n, n] strictly upper-triangular, offset
+
+
+''' Encode '''
+
+def bit_weights(widths:List[int], steps:ndarray=None) -> ndarray:
+  ''' the encoding matrix E [n_var, n_bit], x = low + E @ bits, bits of each variable go MSB first, the LSB of x_i weighs steps[i] '''
+  E = np.zeros([len(widths), sum(widths)], dtype=np.int64)
+  k = 0
+  for i, w in enumerate(widths):
+    E[i, k:k+w] = 2 ** np.arange(w - 1, -1, -1) * (1 if steps is None else steps[i])
+    k += w
+  return E
+
+def encode_system(A:ndarray, b:ndarray, widths:List[int], lows:ndarray=None, steps:ndarray=None) -> Tuple[ndarray, ndarray]:
+  ''' A x = b => As bits = bs, i.e. the As of Step 1 in submit_ising.ipynb '''
+  A = np.asarray(A)
+  b = np.asarray(b).flatten()
+  lows = np.zeros(len(widths), dtype=A.dtype) if lows is None else np.asarray(lows)
+  As = A @ bit_weights(widths, steps)
+  bs = b - A @ lows
+  return As, bs
+
+def decode(bits:ndarray, widths:List[int], lows:ndarray=None, steps:ndarray=None) -> ndarray:
+  ''' bits [..., n_bit] => x [..., n_var] '''
+  x = np.asarray(bits) @ bit_weights(widths, steps).T
+  return x if lows is None else x + np.asarray(lows)
+
+def bits_of(bitstr:str) -> ndarray:
+  ''' measured bitstring like '110010111' => bits [n_bit] '''
+  return np.asarray([int(c) for c in bitstr], dtype=np.int64)
+
+
+''' QUBO & Ising '''
+
+def qubo(As:ndarray, bs:ndarray) -> Tuple[ndarray, ndarray, float]:
+  ''' f(bits) = ||As bits - bs||^2 / 2 = bits^T Q bits + q^T bits + c, Q symmetric '''
+  As = np.asarray(As, dtype=np.float64)
+  bs = np.asarray(bs, dtype=np.float64).flatten()
+  Q = As.T @ As / 2
+  q = -As.T @ bs
+  c = float(bs @ bs / 2)
+  return Q, q, c
+
+def qubo_to_ising(Q:ndarray, q:ndarray, c:float) -> Ising:
+  '''
+  substitute bit = (1 - z) / 2 and z_i^2 = 1:
+    bits^T Q bits = (ΣQ - 2 (Q1)^T z + tr(Q) + 2 Σ_{i<j} Q_ij z_i z_j) / 4
+    q^T bits      = (Σq - q^T z) / 2
+  '''
+  h = -(Q.sum(axis=1) + q) / 2
+  J = np.triu(Q, k=1) / 2              # (Q_ij + Q_ji) / 4
+  offset = c + (Q.sum() + np.trace(Q)) / 4 + q.sum() / 2
+  return h, J, float(offset)
+
+def ising_from_system(A:ndarray, b:ndarray, widths:List[int], lows:ndarray=None, steps:ndarray=None) -> Ising:
+  ''' (h, J, offset) of the binary-encoded system A x = b, the numeric replacement of Step 2 in submit_ising.ipynb '''
+  return qubo_to_ising(*qubo(*encode_system(A, b, widths, lows, steps)))
+
+
+''' Hamiltonian '''
+
+def ising_energy(bits:ndarray, h:ndarray, J:ndarray, offset:float) -> ndarray:
+  ''' <bits|H|bits> for bits [n] => float or [B, n] => [B] '''
+  z = 1 - 2 * np.asarray(bits, dtype=np.float64)
+  return offset + z @ h + ((z @ J) * z).sum(axis=-1)
+
+def ising_diag(h:ndarray, J:ndarray, offset:float) -> ndarray:
+  ''' diag(H) [2^n] for small n, basis index k has bit i at (k >> (n-1-i)) & 1, the same order as spinqit/PennyLane wires '''
+  n = len(h)
+  k = np.arange(2**n)
+  bits = (k[:, None] >> np.arange(n - 1, -1, -1)) & 1
+  return ising_energy(bits, h, J, offset)
+
+def ising_terms(h:ndarray, J:ndarray, offset:float, tol:float=1e-12) -> List[Tuple[str, float]]:
+  ''' the sparse Pauli form [('IZIZ..', coeff)], as consumed by spinqit.generate_hamiltonian_matrix() or qml.Hamiltonian '''
+  n = len(h)
+  terms = [('I' * n, offset)]
+  for i in np.nonzero(np.abs(h) > tol)[0]:
+    terms.append((''.join('Z' if k == i else 'I' for k in range(n)), float(h[i])))
+  for i, j in zip(*np.nonzero(np.abs(J) > tol)):
+    terms.append((''.join('Z' if k in [i, j] else 'I' for k in range(n)), float(J[i, j])))
+  return terms
+
+
+
+''' Solve '''
+# all solvers work on spins z = 1 - 2 * bits with the symmetric coupling Js = J + J^T,
+# flipping z_i changes the energy by ΔE_i = -2 z_i F_i, where F = h + z @ Js is the local field
+
+def exhaustive_search(h:ndarray, J:ndarray, offset:float, block_bits:int=16) -> Tuple[ndarray, float]:
+  '''
+  exact ground state by enumerating all 2^n bitstrings
+    the low block_bits spins are evaluated as one vectorized block of 2^block_bits energies,
+    the high spins walk a Gray code, so each step flips one spin and updates the block's fields in O(n)
+  '''
+  n = len(h)
+  m = min(n, block_bits)
+  nh = n - m
+  Js = J + J.T
+  k = np.arange(2**m)
+  Zl = 1 - 2 * ((k[:, None] >> np.arange(m - 1, -1, -1)) & 1).astype(np.float64)    # [2^m, m]
+  quad_l = ((Zl @ J[nh:, nh:]) * Zl).sum(axis=-1)
+
+  zh = np.ones([nh])      # high bits all 0
+  h_eff = h[nh:] + zh @ Js[:nh, nh:]
+  c = offset + zh @ h[:nh] + zh @ J[:nh, :nh] @ zh
+  best_E, best_bits = np.inf, None
+  for g in range(2**nh):
+    if g:
+      i = (g & -g).bit_length() - 1
+      c -= 2 * zh[i] * (h[i] + Js[i, :nh] @ zh)
+      h_eff -= 2 * zh[i] * Js[i, nh:]
+      zh[i] = -zh[i]
+    E = c + Zl @ h_eff + quad_l
+    j = np.argmin(E)
+    if E[j] < best_E:
+      best_E = float(E[j])
+      best_bits = np.concatenate([zh, Zl[j]])
+  return ((1 - best_bits) / 2).astype(np.int64), best_E
+
+def _default_temps(h:ndarray, Js:ndarray, rng:np.random.Generator) -> Tuple[float, float]:
+  ''' T_hot ~ the typical |ΔE| of a flip at random states (acceptance ~1/e), T_cold three decades below '''
+  z = rng.choice([-1.0, 1.0], size=[64, len(h)])
+  T_hot = 2 * np.abs(h + z @ Js).mean()
+  return T_hot, T_hot * 1e-3
+
+def _init_spins(n_chains:int, n:int, rng:np.random.Generator, init_bits:ndarray=None) -> ndarray:
+  if init_bits is None: return rng.choice([-1.0, 1.0], size=[n_chains, n])
+  return np.tile(1 - 2 * np.asarray(init_bits, dtype=np.float64), [n_chains, 1])
+
+def _metropolis_sweep(z:ndarray, F:ndarray, E:ndarray, Js:ndarray, beta:ndarray, rng:np.random.Generator):
+  ''' one in-place single-spin-flip sweep over all spins for all chains at once, beta: [R] '''
+  R, n = z.shape
+  for i in rng.permutation(n):
+    dE = -2 * z[:, i] * F[:, i]
+    acc = (dE <= 0) | (rng.random(R) < np.exp(-np.clip(dE * beta, 0, 700)))
+    s = np.where(acc, z[:, i], 0.0)
+    F -= 2 * s[:, None] * Js[i]
+    z[acc, i] *= -1
+    E += np.where(acc, dE, 0.0)
+
+def simulated_annealing(h:ndarray, J:ndarray, offset:float, n_sweeps:int=1000, n_chains:int=64, T_range:Tuple[float, float]=None,
+                        seed:int=None, init_bits:ndarray=None) -> Tuple[ndarray, float]:
+  ''' n_chains independent annealing runs vectorized, geometric schedule from T_range[0] down to T_range[1] '''
+  rng = np.random.default_rng(seed)
+  Js = J + J.T
+  T_hot, T_cold = T_range or _default_temps(h, Js, rng)
+  z = _init_spins(n_chains, len(h), rng, init_bits)
+  F = h + z @ Js
+  E = offset + z @ h + ((z @ J) * z).sum(axis=-1)
+  best_E, best_z = np.inf, None
+  for T in np.geomspace(T_hot, T_cold, n_sweeps):
+    _metropolis_sweep(z, F, E, Js, np.full([n_chains], 1 / T), rng)
+    j = np.argmin(E)
+    if E[j] < best_E: best_E, best_z = float(E[j]), z[j].copy()
+  return ((1 - best_z) / 2).astype(np.int64), best_E
+
+def parallel_tempering(h:ndarray, J:ndarray, offset:float, n_sweeps:int=1000, n_replicas:int=32, T_range:Tuple[float, float]=None,
+                       seed:int=None, init_bits:ndarray=None) -> Tuple[ndarray, float]:
+  ''' replicas on a fixed geometric temperature ladder, neighbours swap after every sweep (even/odd pairs alternately) '''
+  rng = np.random.default_rng(seed)
+  Js = J + J.T
+  T_hot, T_cold = T_range or _default_temps(h, Js, rng)
+  beta = 1 / np.geomspace(T_cold, T_hot, n_replicas)   # slot 0 is the coldest
+  z = _init_spins(n_replicas, len(h), rng, init_bits)
+  F = h + z @ Js
+  E = offset + z @ h + ((z @ J) * z).sum(axis=-1)
+  best_E, best_z = np.inf, None
+  for sweep in range(n_sweeps):
+    _metropolis_sweep(z, F, E, Js, beta, rng)
+    j = np.argmin(E)
+    if E[j] < best_E: best_E, best_z = float(E[j]), z[j].copy()
+    k = np.arange(sweep % 2, n_replicas - 1, 2)
+    acc = np.log(rng.random(len(k))) < (beta[k] - beta[k + 1]) * (E[k] - E[k + 1])
+    a, b = k[acc], k[acc] + 1
+    for arr in [z, F]: arr[a], arr[b] = arr[b].copy(), arr[a].copy()
+    E[a], E[b] = E[b].copy(), E[a].copy()
+  return ((1 - best_z) / 2).astype(np.int64), best_E
+
+def ry_warm_start(bits:ndarray, eps:float=0.0) -> ndarray:
+  '''
+  params of the RY-array ansatz in submit_ising.ipynb that prepare |bits>, since RY(π)|0> = |1>
+    eps > 0 pulls them towards π/2 so the VQE still has gradient to refine a classical guess
+  '''
+  return np.pi * np.asarray(bits, dtype=np.float64) * (1 - 2 * eps) + np.pi * eps
+
+
+
+''' Range '''
+# the widths in submit_ising.ipynb were read off the known answer, here they come from the system itself
+
+def infer_ranges(A:ndarray, b:ndarray, method:str='lstsq', pad:int=1) -> Tuple[ndarray, ndarray]:    # lows, highs (inclusive)
+  '''
+  integer box that should hold the solution
+    - 'lstsq': around the real relaxation x* = argmin ||Ax - b||, [floor(x*) - pad, ceil(x*) + pad]
+    - 'norm':  |x_i| <= ||x||_2 <= ||b||_2 / σmin(A), safe but loose
+  '''
+  A = np.asarray(A, dtype=np.float64)
+  b = np.asarray(b, dtype=np.float64).flatten()
+  if method == 'lstsq':
+    x = np.linalg.lstsq(A, b, rcond=None)[0]
+    return np.floor(x).astype(np.int64) - pad, np.ceil(x).astype(np.int64) + pad
+  if method == 'norm':
+    R = int(np.floor(np.linalg.norm(b) / np.linalg.svd(A, compute_uv=False)[-1]))
+    return np.full(A.shape[1], -R, dtype=np.int64), np.full(A.shape[1], R, dtype=np.int64)
+  raise ValueError(f'unknown method: {method}')
+
+def widths_for(lows:ndarray, highs:ndarray, steps:ndarray=None) -> List[int]:
+  ''' bits needed to reach every value lows + steps * k <= highs '''
+  steps = np.ones_like(lows) if steps is None else np.asarray(steps)
+  n_vals = (np.asarray(highs) - np.asarray(lows)) // steps + 1
+  return [max(1, int(np.ceil(np.log2(v)))) for v in n_vals.tolist()]
+
+def solve_coarse_to_fine(A:ndarray, b:ndarray, lows:ndarray, highs:ndarray, n_bits:int=3, margin:int=2,
+                         solver:Callable[[ndarray, ndarray, float], Tuple[ndarray, float]]=exhaustive_search,
+                         verbose:bool=False) -> Tuple[ndarray, float, int]:
+  '''
+  multi-resolution solve, each round only spends n_bits per variable:
+    x_i = low_i + step_i * k_i with step_i = ceil((high_i - low_i + 1) / 2^n_bits), solve the small Ising,
+    then re-center the box at the answer with half-width margin * step_i and repeat with at least half the step until it is 1
+  the coarse optimum may drift off the true one along ill-conditioned directions of A, check the returned energy
+  returns x, the final energy ||Ax - b||^2 / 2 and the number of rounds
+  '''
+  lows, highs = np.asarray(lows, dtype=np.int64), np.asarray(highs, dtype=np.int64)
+  n_round = 0
+  steps = None
+  while True:
+    n_round += 1
+    new_steps = np.maximum(1, -(-(highs - lows + 1) // 2**n_bits))
+    steps = new_steps if steps is None else np.maximum(1, np.minimum(new_steps, steps // 2))   # at least halve, at the price of a few more bits
+    widths = widths_for(lows, highs, steps)
+    bits, E = solver(*ising_from_system(A, b, widths, lows, steps))
+    x = decode(bits, widths, lows, steps)
+    if verbose: print(f'[round {n_round}] steps: {steps.tolist()}, n_spin: {sum(widths)}, x: {x.tolist()}, energy: {E}')
+    if (steps == 1).all(): return x, E, n_round
+    lows, highs = x - margin * steps, x + margin * steps
+
+
+if __name__ == '__main__':
+  from time import time
+  from utils import Am, bv, xv
+
+  # the system in submit_ising.ipynb, x1/x2/x3 take 4/3/2 bits
+  widths = [4, 3, 2]
+  As, bs = encode_system(Am, bv, widths)
+  print('[As]')
+  print(As)
+  h, J, offset = ising_from_system(Am, bv, widths)
+  ts = time()
+  bits, E0 = exhaustive_search(h, J, offset)
+  print(f'min. energy: {E0}, bits: {bits}, found in {time() - ts:.4f}s')
+  print('solution:', decode(bits, widths))
+  assert np.allclose(decode(bits, widths), xv.flatten())
+
+  # warm start of the RY-array VQE: the classical answer is already its ground state
+  from simulator import run_circuit
+  n_qubits = sum(widths)
+  gates = [('RY', (i,), i) for i in range(n_qubits)]
+  probs = run_circuit(gates, ry_warm_start(bits, eps=0.05), n_qubits)**2
+  print('VQE energy at the warm start:', probs @ ising_diag(h, J, offset))
+
+  # a large random integer system, the dense H would have 2^48 entries
+  rng = np.random.default_rng(1024)
+  n_var, width = 8, 6
+  A = rng.integers(-9, 10, size=[n_var, n_var])
+  x = rng.integers(0, 2**width, size=[n_var])
+  ts = time()
+  h, J, offset = ising_from_system(A, A @ x, [width] * n_var)
+  print(f'built Ising of {len(h)} spins in {time() - ts:.4f}s')
+  x_bits = np.concatenate([bits_of(np.binary_repr(v, width)) for v in x])
+  print('energy at the true solution:', ising_energy(x_bits, h, J, offset))
+  for solver in [simulated_annealing, parallel_tempering]:
+    ts = time()
+    bits, E = solver(h, J, offset, seed=1024)
+    print(f'[{solver.__name__}] energy: {E}, solved: {np.all(decode(bits, [width] * n_var) == x)}, time: {time() - ts:.3f}s')
+
+  # widths inferred from the system, and a coarse-to-fine solve of answers up to ~1000 from a loose norm box
+  lows, highs = infer_ranges(Am, bv)
+  print('inferred box:', lows.tolist(), highs.tolist(), ', widths:', widths_for(lows, highs), f'(vs {widths})')
+  A = rng.integers(-9, 10, size=[6, 6]) + 30 * np.eye(6, dtype=np.int64)    # diagonally dominant, see the note in solve_coarse_to_fine()
+  x = rng.integers(-1000, 1000, size=[6])
+  b = A @ x
+  lows, highs = infer_ranges(A, b, method='norm')
+  print(f'norm box: ±{highs[0]}, {sum(widths_for(lows, highs))} spins if encoded at once')
+  ts = time()
+  x_hat, E, n_round = solve_coarse_to_fine(A, b, lows, highs, n_bits=3, verbose=True)
+  print(f'coarse-to-fine: solved: {np.all(x_hat == x)}, energy: {E}, rounds: {n_round}, time: {time() - ts:.3f}s')
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+# 损失地形扫描: 小 ansatz 的参数空间可以整体铺点求值，用来挑初值 & 诊断
+# points come from a periodic grid or a scrambled Sobol sequence over [-π, π)^P, costs are evaluated in large batches
+# on the native simulator and cached on disk; the best separated basins seed the optimizer
+
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+import numpy as np
+from numpy import ndarray
+
+from utils import LOG_PATH
+from simulator import Gate, n_params, ansatz_cost
+from cache import result_key
+
+LANDSCAPE_PATH = LOG_PATH / 'landscape'
+
+CostBatchFn = Callable[[ndarray], ndarray]    # [B, n_param] => [B]
+
+
+''' Points '''
+
+def grid_points(n_param:int, n_per_dim:int=16, lo:float=-np.pi, hi:float=np.pi) -> ndarray:
+  ''' the full periodic grid [n_per_dim^P, P], hi is excluded since the cost is 2π-periodic in every param '''
+  axis = np.linspace(lo, hi, n_per_dim, endpoint=False)
+  return np.stack(np.meshgrid(*[axis] * n_param, indexing='ij'), axis=-1).reshape(-1, n_param)
+
+def sobol_points(n_param:int, n_points:int=2**14, seed:int=0, lo:float=-np.pi, hi:float=np.pi) -> ndarray:
+  ''' scrambled Sobol points [n_points, P], n_points is rounded up to a power of 2 '''
+  from scipy.stats import qmc
+  m = int(np.ceil(np.log2(n_points)))
+  return lo + (hi - lo) * qmc.Sobol(d=n_param, scramble=True, seed=seed).random_base2(m)
+
+
+''' Scan '''
+
+def scan(cost_fn:CostBatchFn, points:ndarray, chunk:int=2**14) -> ndarray:
+  ''' costs [M] of points [M, P], chunk by chunk to bound the memory of the batched states '''
+  return np.concatenate([cost_fn(points[i:i+chunk]) for i in range(0, len(points), chunk)])
+
+def scan_landscape(gates:List[Gate], A:ndarray, b:ndarray, nq:int=None, method:str='sobol', n_points:int=2**14, n_per_dim:int=16,
+                   seed:int=0, use_cache:bool=True) -> Tuple[ndarray, ndarray]:
+  ''' points [M, P] and costs [M] of the VALA cost of an ansatz, cached in LANDSCAPE_PATH by (A, b, gates, sampling spec) '''
+  P = n_params(gates)
+  if   method == 'sobol': spec = {'n_points': n_points, 'seed': seed}
+  elif method == 'grid':  spec = {'n_per_dim': n_per_dim}
+  else: raise ValueError(f'unknown method: {method}')
+  fp = LANDSCAPE_PATH / f'{result_key(A, b, gates=gates, method=method, **spec)}.npz'
+  if use_cache and fp.exists():
+    with np.load(fp) as data:
+      return data['points'], data['costs']
+
+  points = sobol_points(P, n_points, seed) if method == 'sobol' else grid_points(P, n_per_dim)
+  costs = scan(lambda ps: ansatz_cost(gates, A, b, ps, nq), points)
+  if use_cache:
+    LANDSCAPE_PATH.mkdir(parents=True, exist_ok=True)
+    np.savez(fp, points=points, costs=costs)
+  return points, costs
+
+def periodic_dist(p:ndarray, q:ndarray) -> ndarray:
+  ''' distance on the torus [-π, π)^P, broadcasting over leading dims '''
+  d = (np.asarray(p) - np.asarray(q) + np.pi) % (2 * np.pi) - np.pi
+  return np.linalg.norm(d, axis=-1)
+
+def best_basins(points:ndarray, costs:ndarray, k:int=8, min_dist:float=0.5) -> Tuple[ndarray, ndarray]:
+  ''' greedily pick up to k lowest-cost points that are pairwise at least min_dist apart, i.e. one seed per basin '''
+  seeds: List[int] = []
+  for i in np.argsort(costs):
+    if all(periodic_dist(points[i], points[j]) >= min_dist for j in seeds):
+      seeds.append(i)
+      if len(seeds) >= k: break
+  return points[seeds], costs[seeds]
+
+
+''' Slice '''
+
+def slice_2d(cost_fn:CostBatchFn, center:ndarray, dims:Tuple[int, int]=(0, 1), n:int=101, span:float=np.pi) -> Tuple[ndarray, ndarray, ndarray]:
+  ''' the cost on the plane through center along params dims, (U, V, Z) each [n, n] ready for plt.contourf '''
+  center = np.asarray(center, dtype=np.float64)
+  axis = np.linspace(-span, span, n)
+  U, V = np.meshgrid(center[dims[0]] + axis, center[dims[1]] + axis, indexing='ij')
+  points = np.tile(center, [n * n, 1])
+  points[:, dims[0]] = U.flatten()
+  points[:, dims[1]] = V.flatten()
+  return U, V, scan(cost_fn, points).reshape(n, n)
+
+def plot_slice(U:ndarray, V:ndarray, Z:ndarray, fp:Path, dims:Tuple[int, int]=(0, 1), center:ndarray=None):
+  import matplotlib.pyplot as plt
+  plt.clf()
+  plt.contourf(U, V, np.log10(np.maximum(Z, 1e-12)), levels=50, cmap='viridis')
+  plt.colorbar(label='log10(cost)')
+  if center is not None: plt.plot(center[dims[0]], center[dims[1]], 'r*')
+  plt.xlabel(f'θ{dims[0]}')
+  plt.ylabel(f'θ{dims[1]}')
+  plt.tight_layout()
+  print(f'>> save landscape slice to: {fp}')
+  plt.savefig(fp, dpi=400)
+
+
+if __name__ == '__main__':
+  from time import time
+  from utils import preprocess
+  from simulator import ansatz_spinqit, ansatz_grad_adjoint
+  from optim import Momentum
+  from trainer import Trainer
+
+  A, b, x = preprocess()
+  nq = int(np.log2(A.shape[0]))
+
+  # scan, seed from the best basins, then train briefly from each seed:
+  # if no seed reaches ~0 the ansatz lacks expressivity, if some do the zero init was just a bad start
+  best_param = {}
+  for name in ['wtf', 'swap_distro', 'two_local']:
+    gates = ansatz_spinqit(name)
+    ts = time()
+    points, costs = scan_landscape(gates, A, b, nq, method='sobol', n_points=2**16)
+    print(f'[{name}] scanned {len(points)} points in {time() - ts:.3f}s, min cost: {costs.min():.4g}')
+    seeds, seed_costs = best_basins(points, costs, k=4)
+
+    def grad_fn(p:ndarray) -> ndarray:
+      grad_fn.forward, grad = ansatz_grad_adjoint(gates, A, b, p, nq, with_cost=True)
+      return grad
+
+    finals, params = [], []
+    for p in seeds:
+      trainer = Trainer(Momentum(stepsize=1.5, momentum=0.92), lambda p: ansatz_cost(gates, A, b, p, nq), grad_fn, iters=500, tol=1e-12, log_every=0)
+      params.append(trainer.fit(p))
+      finals.append(trainer.losses[-1])
+    best_param[name] = params[np.argmin(finals)]
+    print(f'  seed costs: {np.round(seed_costs, 6).tolist()}')
+    print(f'  trained:    {[f"{v:.3g}" for v in finals]}')
+    print(f'  => {"expressive enough" if min(finals) < 1e-8 else "lacks expressivity (or needs more iters)"}')
+
+  gates = ansatz_spinqit('wtf')
+  U, V, Z = slice_2d(lambda ps: ansatz_cost(gates, A, b, ps, nq), best_param['wtf'], dims=(0, 1))
+  plot_slice(U, V, Z, LOG_PATH / 'landscape.png', center=best_param['wtf'])
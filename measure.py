@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+
+# 测量规划: 把 H = Σ c_k P_k 的 Pauli 项分成逐比特对易 (qubit-wise commuting, QWC) 的组，每组只需一条换基线路
+# two Paulis are QWC iff on every qubit they act the same or one of them is I, then a single basis rotation
+# (X: RY(-π/2), Y: RZ(-π/2) RY(-π/2), Z: none) diagonalizes the whole group, and every term of the group is read
+# out as a parity of the same computational-basis samples: <P> = Σ_r p(r) (-1)^|r & supp(P)|
+
+from typing import Callable, List, Tuple, Union
+
+import numpy as np
+from numpy import ndarray
+
+from utils import popcount, sample_state, pauli_strings
+from simulator import Gate, apply_ry, apply_rz, run_circuit
+
+
+''' Grouping '''
+
+def qwc_groups(xs:ndarray, zs:ndarray, order:ndarray=None) -> Tuple[List[ndarray], List[Tuple[int, int]]]:
+  '''
+  greedy first-fit packing of Pauli terms (packed bitmasks) into QWC groups, visiting terms in order;
+  return the term indexes of each group and its measurement basis (bx, bz) given as a packed Pauli word
+  '''
+  order = np.arange(len(xs)) if order is None else order
+  gxs: List[int] = []
+  gzs: List[int] = []
+  members: List[List[int]] = []
+  for i in order.tolist():
+    x, z = int(xs[i]), int(zs[i])
+    s = x | z
+    for g in range(len(members)):
+      if ((gxs[g] ^ x) | (gzs[g] ^ z)) & (gxs[g] | gzs[g]) & s == 0:   # agree on the shared support
+        gxs[g] |= x
+        gzs[g] |= z
+        members[g].append(i)
+        break
+    else:
+      gxs.append(x)
+      gzs.append(z)
+      members.append([i])
+  return [np.asarray(m) for m in members], list(zip(gxs, gzs))
+
+def parity_signs(supp:ndarray, nq:int) -> ndarray:
+  ''' eigenvalues [T, 2^n] of the diagonalized terms on each basis state, (-1)^|r & supp| '''
+  r = np.arange(2**nq)
+  return 1 - 2 * (popcount(np.asarray(supp)[:, None] & r[None, :]) & 1)
+
+def rotate_basis(psi:ndarray, bx:int, bz:int, nq:int) -> ndarray:
+  ''' rotate states [2^n] or batched [B, 2^n] so that measuring Z reads the Pauli word (bx, bz) on the native simulator '''
+  is_batch = len(psi.shape) == 2
+  out = np.array(psi if is_batch else psi[None, :], dtype=np.complex128)
+  θ = np.full([len(out)], -np.pi / 2)
+  for w in range(nq):
+    bit = 1 << (nq - 1 - w)
+    if not bx & bit: continue
+    if bz & bit: apply_rz(out, nq, w, θ)    # S^† up to a global phase, Y => X
+    apply_ry(out, nq, w, θ)                 # X => Z
+  return out if is_batch else out[0]
+
+def qml_basis_rotations(bx:int, bz:int, nq:int) -> list:
+  ''' the same basis change as rotate_basis() as PennyLane ops, call it inside a QNode right before measuring '''
+  import pennylane as qml
+  ops = []
+  for w in range(nq):
+    bit = 1 << (nq - 1 - w)
+    if not bx & bit: continue
+    if bz & bit: ops.append(qml.RZ(-np.pi / 2, wires=w))
+    ops.append(qml.RY(-np.pi / 2, wires=w))
+  return ops
+
+
+''' Plan '''
+
+class MeasurePlan:
+
+  '''
+  QWC measurement plan of a hermitian H = Σ c_k P_k, the identity term is a constant and needs no circuit;
+  terms are packed largest |c| first, so the heavy terms share groups and the tail fills in the gaps
+  '''
+
+  def __init__(self, xs:ndarray, zs:ndarray, coeffs:ndarray, nq:int):
+    assert np.isrealobj(coeffs), 'coeffs should be real, i.e. H is hermitian'
+    self.nq = nq
+    is_id = (xs == 0) & (zs == 0)
+    self.const = float(coeffs[is_id].sum())
+    self.xs, self.zs, self.coeffs = xs[~is_id], zs[~is_id], coeffs[~is_id]
+    self.groups, self.bases = qwc_groups(self.xs, self.zs, np.argsort(-np.abs(self.coeffs), kind='stable'))
+    self._signs = [parity_signs(self.xs[g] | self.zs[g], nq) for g in self.groups]
+    self._values = [self.coeffs[g] @ signs for g, signs in zip(self.groups, self._signs)]   # O_k = Σ_{i∈k} c_i P_i on each outcome
+
+  @property
+  def n_terms(self) -> int:
+    return len(self.coeffs)
+
+  @property
+  def n_groups(self) -> int:
+    return len(self.groups)
+
+  def basis_str(self, k:int) -> str:
+    ''' e.g. 'XZY', I means the qubit is not measured by group k '''
+    bx, bz = self.bases[k]
+    return pauli_strings(np.asarray([bx]), np.asarray([bz]), self.nq)[0]
+
+  def rotate(self, k:int, psi:ndarray) -> ndarray:
+    ''' rotate states [2^n] or batched [B, 2^n] into the measurement basis of group k on the native simulator '''
+    return rotate_basis(psi, *self.bases[k], self.nq)
+
+  def qml_rotations(self, k:int) -> list:
+    ''' the same basis change as rotate() as PennyLane ops, call it inside a QNode right before measuring '''
+    return qml_basis_rotations(*self.bases[k], self.nq)
+
+  def expvals(self, k:int, counts:ndarray) -> ndarray:
+    ''' <P_i> of the terms in group k from the counts [2^n] of its rotated circuit '''
+    return self._signs[k] @ counts / counts.sum()
+
+  def moments(self, k:int, counts:ndarray) -> Tuple[float, float]:
+    ''' sample mean and single-shot variance of the group observable O_k from the counts [2^n] of its circuit '''
+    p = counts / counts.sum()
+    mean = p @ self._values[k]
+    return mean, p @ (self._values[k] - mean)**2
+
+  def energy(self, counts_list:List[ndarray]) -> float:
+    ''' <H> reassembled from the counts of every group circuit '''
+    return self.const + sum(values @ counts / counts.sum() for values, counts in zip(self._values, counts_list))
+
+  def exact(self, psi:ndarray) -> float:
+    ''' the shot-free limit of energy(), via the probabilities of the rotated states '''
+    return self.const + sum(values @ np.abs(self.rotate(k, psi))**2 for k, values in enumerate(self._values))
+
+  def sample(self, psi:ndarray, n_shots:Union[int, ndarray], rng:np.random.Generator=None) -> List[ndarray]:
+    ''' counts [2^n] of each group circuit on the native simulator, n_shots is flat or per group '''
+    n_shots = np.broadcast_to(n_shots, [self.n_groups])
+    return [sample_state(self.rotate(k, psi), int(n_shots[k]), rng) for k in range(self.n_groups)]
+
+
+''' Shot Allocation '''
+
+class ShotAllocator:
+
+  '''
+  Split a shot budget over the groups of a MeasurePlan, n_k ∝ σ_k (Neyman allocation), which minimizes
+    Var(<H>) = Σ_k σ_k^2 / n_k  s.t.  Σ_k n_k = budget,  giving Var(<H>) = (Σ_k σ_k)^2 / budget
+  σ_k is the single-shot std of O_k = Σ_{i∈k} c_i P_i, it starts from the bound Σ_{i∈k} |c_i| and then tracks an
+  exponential moving average of the observed variances; for single-term groups this is the |c_i| σ_i rule.
+  With rel_err set, adapt() raises the budget (never lowers) until std(<H>) <= rel_err * loss, up to max_budget,
+  so that the shots follow the precision the loss actually needs as it approaches 0
+  '''
+
+  def __init__(self, plan:MeasurePlan, budget:int, min_shots:int=16, decay:float=0.9, rel_err:float=None, max_budget:int=None):
+    self.plan = plan
+    self.budget = budget
+    self.min_shots = min_shots
+    self.decay = decay
+    self.rel_err = rel_err
+    self.max_budget = max_budget or budget
+    self.var = np.asarray([np.abs(plan.coeffs[g]).sum()**2 for g in plan.groups])
+    self.n_used = 0
+
+  @property
+  def std(self) -> float:
+    ''' the predicted std of the next <H> estimate '''
+    return np.sqrt(self.var).sum() / np.sqrt(self.budget)
+
+  def allocate(self) -> ndarray:
+    ''' shots per group [K], at least min_shots each, rounded by largest remainder '''
+    σ = np.sqrt(self.var)
+    w = σ / σ.sum() if σ.sum() > 0 else np.full_like(σ, 1 / len(σ))
+    n_free = max(self.budget - self.min_shots * len(w), 0)
+    share = n_free * w
+    n = np.floor(share).astype(np.int64)
+    n[np.argsort(n - share)[:n_free - n.sum()]] += 1
+    return n + self.min_shots
+
+  def update(self, counts_list:List[ndarray]) -> float:
+    ''' fold in the counts of one round, return the <H> estimate '''
+    for k, counts in enumerate(counts_list):
+      _, var = self.plan.moments(k, counts)
+      self.var[k] = self.decay * self.var[k] + (1 - self.decay) * var
+    self.n_used += sum(int(c.sum()) for c in counts_list)
+    return self.plan.energy(counts_list)
+
+  def adapt(self, loss:float) -> int:
+    ''' raise the budget for the precision rel_err * loss, feed a smoothed loss as single estimates may hit ~0 by noise '''
+    if self.rel_err is not None:
+      need = (np.sqrt(self.var).sum() / (self.rel_err * max(loss, 1e-12)))**2
+      self.budget = int(min(max(self.budget, need), self.max_budget))
+    return self.budget
+
+  def estimate(self, sample_fn:Callable[[int, int], ndarray]) -> float:
+    '''
+    one <H> estimate with the current allocation
+      sample_fn: (group k, n_shots) => counts [2^n] of the rotated circuit of group k
+    '''
+    return self.update([sample_fn(k, n) for k, n in enumerate(self.allocate().tolist())])
+
+
+''' Shot-based Gradient '''
+
+def shot_grad_param_shift(gates:List[Gate], estimate_fn:Callable[[ndarray], float], param:ndarray, nq:int=None) -> ndarray:
+  '''
+  parameter-shift gradient where every shifted cost is estimated from shots by estimate_fn: state [2^n] => float,
+  the 2*n_param shifted states are simulated as one batch like simulator.ansatz_grad_param_shift()
+  '''
+  param = np.asarray(param, dtype=np.float64)
+  P = len(param)
+  shifts = np.concatenate([np.eye(P), -np.eye(P)]) * (np.pi / 2)
+  costs = np.asarray([estimate_fn(psi) for psi in run_circuit(gates, param + shifts, nq)]).reshape(2, P)
+  return (costs[0] - costs[1]) / 2
+
+
+if __name__ == '__main__':
+  from utils import preprocess, pauli_transform, I_
+  from simulator import ansatz_original, n_params
+
+  A, b, x = preprocess()
+  nq = int(np.log2(A.shape[0]))
+  b = b.reshape(-1, 1)
+  H_A = A.conj().T @ (I_(nq) - b @ b.conj().T) @ A
+
+  gates = ansatz_original(nq, 1)
+  psi = run_circuit(gates, np.random.uniform(-np.pi, np.pi, size=[n_params(gates)]), nq)
+  rng = np.random.default_rng(42)
+
+  for name, H in [('H_A', H_A), ('random 5-qubit', (lambda M: M + M.T)(rng.normal(size=[32, 32])))]:
+    n = int(np.log2(H.shape[0]))
+    xs, zs, coeffs = pauli_transform(H)
+    plan = MeasurePlan(xs, zs, coeffs, n)
+    phi = psi if n == nq else run_circuit(ansatz_original(n, 1), rng.uniform(-np.pi, np.pi, size=[n * 6]), n)
+    E = (phi.conj() @ H @ phi).real
+    assert np.isclose(plan.exact(phi), E)
+    n_shots = 10000
+    E_q = plan.energy(plan.sample(phi, n_shots, rng))
+    print(f'[{name}] {plan.n_terms} terms => {plan.n_groups} circuits ({plan.n_terms / plan.n_groups:.1f}x fewer)')
+    print(f'  bases: {[plan.basis_str(k) for k in range(plan.n_groups)][:8]}{" ..." if plan.n_groups > 8 else ""}')
+    print(f'  <H> exact: {E:.6f}, from {n_shots} shots/group: {E_q:.6f}')
+
+  # shot-based training of the simple ansatz on H_A: a flat n_shots per circuit vs. the variance-aware allocator,
+  # whose budget starts small and grows with the precision a smoothed loss asks for, capped 5x below the flat one
+  from utils import get_fidelity
+  from simulator import ansatz_simple
+
+  xs, zs, coeffs = pauli_transform(H_A)
+  plan = MeasurePlan(xs, zs, coeffs, nq)
+  gates = ansatz_simple()
+  n_flat = 100000
+  alloc = ShotAllocator(plan, budget=1000, rel_err=0.5, max_budget=n_flat)
+  n_used = {'flat': 0}
+
+  def estimate_flat(psi:ndarray) -> float:
+    n_used['flat'] += n_flat * plan.n_groups
+    return plan.energy(plan.sample(psi, n_flat, rng))
+
+  def estimate_alloc(psi:ndarray) -> float:
+    return alloc.estimate(lambda k, n: sample_state(plan.rotate(k, psi), n, rng))
+
+  print()
+  for name, estimate_fn in [('flat', estimate_flat), ('alloc', estimate_alloc)]:
+    p = np.zeros([n_params(gates)])
+    a = np.zeros_like(p)
+    loss = None
+    for _ in range(200):    # Momentum(1.5, 0.92)
+      if name == 'alloc':
+        l = estimate_fn(run_circuit(gates, p, nq))
+        loss = l if loss is None else 0.8 * loss + 0.2 * l
+        alloc.adapt(loss)
+      a = 0.92 * a + 1.5 * shot_grad_param_shift(gates, estimate_fn, p, nq)
+      p = p - a
+    shots = n_used['flat'] if name == 'flat' else alloc.n_used
+    print(f'[{name}] infidelity: {1 - get_fidelity(run_circuit(gates, p, nq), x):.3e}, shots: {shots:.3e}')
+    if name == 'alloc': print(f'  final budget: {alloc.budget}, split: {alloc.allocate().tolist()}')
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+# 纯 numpy 的优化器，可直接作用于批量参数 [B, n_param]
+# https://arxiv.org/abs/1905.09692 Structure optimization for parameterized quantum circuits (Rotosolve)
+
+from typing import Callable, Tuple
+
+import numpy as np
+from numpy import ndarray
+
+CostFn = Callable[[ndarray], float]   # [n_param] => float, or [B, n_param] => [B] if batched
+GradFn = Callable[[ndarray], ndarray] # same shape as param
+
+
+class Momentum:
+
+  '''
+  Numpy twin of qml.MomentumOptimizer, works elementwise so a batch of params [B, n_param] trains at once
+    a <- m * a + lr * g
+    θ <- θ - a
+  '''
+
+  def __init__(self, stepsize:float=0.01, momentum:float=0.9):
+    self.stepsize = stepsize
+    self.momentum = momentum
+    self.accumulation = None
+
+  def step_and_cost(self, cost_fn:CostFn, param:ndarray, grad_fn:GradFn=None) -> Tuple[ndarray, float]:
+    ''' grad_fn is required; if it carries the attribute `forward` (like qml grad), it is used as the cost prior to the step '''
+    assert grad_fn is not None, 'Momentum needs an explicit grad_fn'
+    grad = grad_fn(param)
+    cost = getattr(grad_fn, 'forward', None)
+    if cost is None: cost = cost_fn(param)
+    if self.accumulation is None: self.accumulation = np.zeros_like(grad)
+    self.accumulation = self.momentum * self.accumulation + self.stepsize * grad
+    return param - self.accumulation, cost
+
+  def step(self, cost_fn:CostFn, param:ndarray, grad_fn:GradFn=None) -> ndarray:
+    return self.step_and_cost(cost_fn, param, grad_fn)[0]
+
+
+class Rotosolve:
+
+  '''
+  Sequential analytic minimizer for ansatzes where each param enters one RY/RZ gate exactly once.
+  The cost is then a sinusoid in every single param θ_k:
+    C(θ) = c + a cos(θ - φ) + b sin(θ - φ)
+  three values C(φ), C(φ±π/2) fix (a, b, c), and the minimum θ* = φ + atan2(b, a) + π is jumped to directly;
+  C(φ) is known from the previous jump, so a sweep costs 2*n_param evaluations, the same as one param-shift gradient;
+  it is lr-free, but being coordinate descent it pays off only when the params are loosely coupled: to loss 1e-12 on
+  the Jiuzhang system it takes ~1/6 the circuit evaluations of Momentum + param-shift with the 'original' ansatz,
+  and about as many with the 'simple' ansatz, whose 3 params zig-zag (see the demo below)
+  Exposes the step_and_cost() interface of qml optimizers, one step is a full sweep over all params;
+  converged is set when a sweep improves the cost less than tol, n_evals counts the circuit evaluations.
+  '''
+
+  def __init__(self, batched:bool=False, tol:float=1e-12):
+    self.batched = batched    # cost_fn accepts [B, n_param], then the two shifted evaluations go as one batch
+    self.tol = tol            # converged when a sweep improves the cost less than this
+    self.cost = None          # cost after the last step, known analytically
+    self.converged = False
+    self.n_evals = 0
+
+  def _eval_shifted(self, cost_fn:CostFn, param:ndarray, k:int) -> Tuple[float, float]:
+    p_pos = param.copy() ; p_pos[k] += np.pi / 2
+    p_neg = param.copy() ; p_neg[k] -= np.pi / 2
+    if self.batched:
+      C_pos, C_neg = cost_fn(np.stack([p_pos, p_neg]))
+    else:
+      C_pos, C_neg = cost_fn(p_pos), cost_fn(p_neg)
+    self.n_evals += 2
+    return float(C_pos), float(C_neg)
+
+  def step_and_cost(self, cost_fn:CostFn, param:ndarray, grad_fn=None) -> Tuple[ndarray, float]:
+    ''' one sweep over all params, returns the new params and the cost prior to the step; grad_fn is ignored '''
+    param = np.array(param, dtype=np.float64)
+    if self.cost is None:
+      self.cost = float(cost_fn(param))
+      self.n_evals += 1
+    cost_prev = self.cost
+    C0 = cost_prev
+    for k in range(len(param)):
+      C_pos, C_neg = self._eval_shifted(cost_fn, param, k)
+      c = (C_pos + C_neg) / 2
+      a = C0 - c
+      b = (C_pos - C_neg) / 2
+      param[k] = np.angle(np.exp(1j * (param[k] + np.arctan2(b, a) + np.pi)))   # wrap to (-π, π]
+      C0 = c - np.hypot(a, b)
+    self.cost = C0
+    self.converged = cost_prev - C0 < self.tol
+    return param, cost_prev
+
+  def step(self, cost_fn:CostFn, param:ndarray, grad_fn=None) -> ndarray:
+    return self.step_and_cost(cost_fn, param, grad_fn)[0]
+
+
+def rotosolve(cost_fn:CostFn, param:ndarray, max_sweeps:int=100, tol:float=1e-12, batched:bool=False) -> Tuple[ndarray, list]:
+  ''' sweep Rotosolve until convergence, returns the optimal params and the cost after each sweep '''
+  opt = Rotosolve(batched=batched, tol=tol)
+  losses = []
+  for _ in range(max_sweeps):
+    param, _ = opt.step_and_cost(cost_fn, param)
+    losses.append(opt.cost)
+    if opt.converged: break
+  return param, losses
+
+
+if __name__ == '__main__':
+  from utils import preprocess
+  from simulator import ansatz_simple, ansatz_original, n_params, ansatz_cost, ansatz_grad_adjoint
+
+  A, b, x = preprocess()
+  nq = int(np.log2(A.shape[0]))
+  target = 1e-12
+
+  # circuit evaluations to reach the target loss, a param-shift gradient costs 2*n_param of them like a sweep
+  for name, gates in [('simple', ansatz_simple()), ('original', ansatz_original(nq, 1))]:
+    n_param = n_params(gates)
+    cost_fn = lambda p: ansatz_cost(gates, A, b, p, nq)
+
+    opt = Rotosolve(batched=True, tol=0.0)
+    p = np.zeros([n_param])
+    for n_sweep in range(1, 3001):
+      p, _ = opt.step_and_cost(cost_fn, p)
+      if opt.cost <= target: break
+    print(f'[{name}] Rotosolve: {n_sweep} sweeps, {opt.n_evals} evals, loss: {opt.cost:.3g}')
+
+    def grad_fn(p:ndarray) -> ndarray:
+      grad_fn.forward, grad = ansatz_grad_adjoint(gates, A, b, p, nq, with_cost=True)
+      return grad
+
+    opt = Momentum(stepsize=1.5, momentum=0.92)
+    p = np.zeros([n_param])
+    for n_step in range(1, 5001):
+      p, cost = opt.step_and_cost(cost_fn, p, grad_fn)
+      if cost <= target: break
+    print(f'[{name}] Momentum:  {n_step} steps, {2 * n_param * n_step} evals (param-shift), loss: {cost:.3g}')
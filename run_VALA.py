@@ -8,6 +8,14 @@
 
 from pprint import pprint
 from utils import *     # allow shadowing
+from optim import Rotosolve
+from trainer import Trainer
+from cache import ResultCache, result_key
+from simulator import ansatz_original, ansatz_simple, run_circuit, ansatz_cost, ansatz_grad_param_shift, ansatz_grad_adjoint
+from landscape import scan_landscape, best_basins, slice_2d, plot_slice
+from measure import MeasurePlan, ShotAllocator, qml_basis_rotations
+from decode import expected_l1, sample_to_l1, sample_signed, qml_interference
+from shadow import collect
 import pennylane as qml
 from pennylane import numpy as np
 from pennylane.tape import QuantumTape
@@ -24,14 +32,33 @@ if circ_type == 'original':
 elif circ_type == 'simple':
   n_param = n_qubits + 1
 n_shots = 100000
+l1_target = 0.05    # QMeasure also samples just enough shots for this expected L1 err of the decoded x
+optim_type = 'momentum'   # 'momentum' or 'rotosolve' (lr-free, one iter is a full sweep)
+backend = 'native'     # 'native' (simulator.py, always matrix-free) or 'pennylane'
+ham_type = 'matfree'   # 'pauli' or 'matfree', for the pennylane backend
+grad_method = 'adjoint'   # 'adjoint' or 'param_shift', for the native backend
 lr = 1.5
 iters = 3000
+tol = 1e-12         # stop when loss <= tol
+grad_tol = 1e-12    # stop when ||grad|| <= grad_tol
+patience = 300      # stop when the loss plateaus for so many iters
+log_every = 100
+ckpt_every = 100    # checkpoint optimizer state & stream history to LOG_PATH/run_VALA.ckpt
+resume = False      # continue from the last checkpoint
+use_cache = True    # reuse the result of an identical (A, b, ansatz, hparams) run from LOG_PATH/results
+init = 'zeros'      # 'zeros' or 'scan' (start from the best basin of a Sobol scan of the landscape, see landscape.py)
 
 print('depth:', depth)
 print('n_qubits:', n_qubits)
 print('n_param:', n_param)
+print('backend:', backend)
+print('ham_type:', ham_type)
+print('grad_method:', grad_method)
+print('optim_type:', optim_type)
+print('init:', init)
 print('lr:', lr)
 print('iters:', iters)
+print('tol:', tol)
 print()
 
 
@@ -46,16 +73,21 @@ print()
 ''' Hamiltonian '''
 nq = int(np.ceil(np.log2(A.shape[0])))
 assert n_qubits == nq
-H_A = A.conj().T @ (I_(nq) - b @ b.conj().T) @ A    # Eq. 6
-print_matrix(H_A, 'H_A')
-H = qml.pauli_decompose(H_A)
-print(f'[ham] n_terms: {len(H)}')
-print(repr(H))
+if ham_type == 'pauli':
+  H_A = A.conj().T @ (I_(nq) - b @ b.conj().T) @ A    # Eq. 6
+  print_matrix(H_A, 'H_A')
+  xs, zs, coeffs = pauli_decompose_cached(H_A)
+  H = qml.Hamiltonian(coeffs, [qml.pauli.string_to_pauli_word(s, wire_map={i: i for i in range(nq)}) for s in pauli_strings(xs, zs, nq)])
+  print(f'[ham] n_terms: {len(H)}')
+  print(repr(H))
+elif ham_type == 'matfree':
+  print('[ham] matrix-free: <x|H_A|x> = ||A|x>||^2 - |<b|A|x>|^2')
 print()
 
 
 ''' Ansatz '''
 sim = qml.device('lightning.qubit', wires=nq)
+sim_bp = qml.device('default.qubit', wires=nq)    # backprop through the statevector
 dev = qml.device('lightning.qubit', wires=nq, shots=n_shots)
 
 def circuit_original(param:ndarray) -> List[Operation]:    # Fig. 1
@@ -87,11 +119,21 @@ def circuit_simple(param:ndarray) -> List[Operation]:    # just enough for the c
 
 circuit = eval(f'circuit_{circ_type}')
 
-@qml.qnode(sim)
-def circuit_exp(param:ndarray):
-  global circuit
-  circuit(param)
-  return qml.expval(H)
+if ham_type == 'pauli':
+  @qml.qnode(sim)
+  def circuit_exp(param:ndarray):
+    global circuit
+    circuit(param)
+    return qml.expval(H)
+elif ham_type == 'matfree':
+  @qml.qnode(sim_bp, diff_method='backprop')
+  def circuit_vec(param:ndarray):
+    global circuit
+    circuit(param)
+    return qml.state()
+
+  def circuit_exp(param:ndarray):
+    return vala_cost(A, b, circuit_vec(param))
 
 @qml.qnode(sim)
 def circuit_state(param:ndarray):
@@ -105,28 +147,55 @@ def circuit_sample(param:ndarray):
   circuit(param)
   return qml.sample()
 
+gates = ansatz_original(n_qubits, depth) if circ_type == 'original' else ansatz_simple()
+if backend == 'native':
+  p_chk = np.random.uniform(-np.pi, np.pi, size=[n_param])
+  assert np.allclose(run_circuit(gates, p_chk, nq), circuit_state(p_chk)), 'native ansatz mismatches the qml circuit'
+
+  def circuit_exp(param:ndarray):
+    return ansatz_cost(gates, A, b, param, nq)
+
+  def circuit_grad(param:ndarray):
+    if grad_method == 'param_shift':
+      return ansatz_grad_param_shift(gates, A, b, param, nq)
+    # the forward pass is reused by the qml optimizer as the step cost
+    circuit_grad.forward, grad = ansatz_grad_adjoint(gates, A, b, param, nq, with_cost=True)
+    return grad
+elif backend == 'pennylane':
+  circuit_grad = qml.grad(circuit_exp)    # autograd, keeps the forward value as the step cost
+
 
 ''' Train '''
-p = np.zeros([n_param], requires_grad=True)
-param_list = [p]
-loss_list = [circuit_exp(p)]
-opt = qml.MomentumOptimizer(stepsize=lr, momentum=0.92)
-for i in range(iters):
-  p, loss = opt.step_and_cost(circuit_exp, p)
-  loss_list.append(circuit_exp(p))
-  param_list.append(p)
-
-  if i % 100 == 0:
-    print(f'[{i}/{iters}] loss: {loss_list[-1]}')
-
-p_opt = param_list[-1]
+cache = ResultCache()
+cache_key = result_key(A, b, circ_type=circ_type, depth=depth, optim_type=optim_type, lr=lr, momentum=0.92, iters=iters, tol=tol, grad_tol=grad_tol, patience=patience, init=init)
+cached = cache.get(cache_key) if use_cache else None
+if cached is not None:
+  print(f'>> load trained result from cache: {cache_key}')
+  p_opt = np.asarray(cached['param'])
+  loss_list = [cached['loss']]
+else:
+  p = np.zeros([n_param], requires_grad=True)
+  if init == 'scan':
+    points, costs = scan_landscape(gates, A, b, nq)
+    seeds, seed_costs = best_basins(points, costs, k=1)
+    print(f'>> init from the best of {len(points)} scanned points, cost: {seed_costs[0]}')
+    p = np.asarray(seeds[0], requires_grad=True)
+  if optim_type == 'momentum':
+    opt = qml.MomentumOptimizer(stepsize=lr, momentum=0.92)
+  elif optim_type == 'rotosolve':
+    opt = Rotosolve(batched=backend != 'pennylane')
+  ckpt_dir = LOG_PATH / f'{Path(__file__).stem}.ckpt'
+  trainer = Trainer(opt, circuit_exp, circuit_grad, iters=iters, tol=tol, grad_tol=grad_tol, patience=patience, log_every=log_every, ckpt_dir=ckpt_dir, ckpt_every=ckpt_every)
+  p_opt = trainer.fit(p, resume=resume)
+  loss_list = trainer.losses
+
 print(f'final loss: {loss_list[-1]}')
-print(f'final param: {param_list[-1]}')
+print(f'final param: {p_opt}')
 print()
 
 
 ''' Plot '''
-print(qml.draw(circuit_exp)(p_opt))
+print(qml.draw(circuit_state)(p_opt))
 
 plt.plot(loss_list, 'b', alpha=0.75, label='loss')
 plt.legend()
@@ -134,6 +203,8 @@ plt.tight_layout()
 fp = LOG_PATH / f'{Path(__file__).stem}.png'
 print(f'>> save loss curve to: {fp}')
 plt.savefig(fp, dpi=400)
+U, V, Z = slice_2d(lambda ps: ansatz_cost(gates, A, b, ps, nq), p_opt, dims=(0, 1))
+plot_slice(U, V, Z, LOG_PATH / f'{Path(__file__).stem}_landscape.png', center=p_opt)
 print()
 
 
@@ -144,31 +215,105 @@ tape = QuantumTape(ops, meas)
 pprint(tape.circuit)
 fp = LOG_PATH / f'{Path(__file__).stem}.qasm'
 print(f'>> export QASM to: {fp}')
+qasm = tape.to_openqasm(measure_all=False)
 with open(fp, 'w', encoding='utf-8') as fh:
-  fh.write(tape.to_openqasm(measure_all=False))
+  fh.write(qasm)
 print()
 
 
 ''' PMeasure '''
 x_tilde = circuit_state(p_opt).real
 print(r'|\tilde{x}>:', x_tilde)
-print('fid:', get_fidelity(x_tilde, x))
+fid = get_fidelity(x_tilde, x)
+print('fid:', fid)
 xv_hat = postprocess(x_tilde)
 print('x:', xv_hat)
 print('L1 err:', np.abs(xv.flatten() - xv_hat).mean())
 print()
 
+if cached is None:
+  cache.put(cache_key, p_opt, loss_list[-1], fid, x_tilde, qasm)
+
 
 ''' QMeasure '''
 raw_samples = circuit_sample(p_opt)
-samples = []
-for sam in raw_samples:
-  samples.append(int(''.join(str(bs) for bs in sam), base=2))
-probs = np.bincount(samples) / n_shots
+probs = sample_counts(raw_samples, nq) / n_shots
 x_tilde_approx = np.sqrt(probs)
 print(r'|\tilde{x_q}>:', x_tilde_approx)
 print('fid:', get_fidelity(x_tilde_approx, x))
 xv_hat_approx = postprocess(x_tilde_approx)
 print('x_q:', xv_hat_approx)
-print('L1 err:', np.abs(xv.flatten() - xv_hat_approx).mean())
+print('L1 err:', np.abs(xv.flatten() - xv_hat_approx).mean(), '(expected: %.4f)' % expected_l1(probs, n_shots))
+print()
+
+# sqrt(probs) drops the signs, the Jiuzhang solution just happens to be all-positive; a few interference circuits recover them
+@qml.qnode(dev)
+def circuit_sample_interfere(param:ndarray, d:int):
+  global circuit
+  circuit(param)
+  qml_interference(d, nq)
+  return qml.sample()
+
+x_tilde_signed, n_circ = sample_signed(
+  lambda k: sample_counts(qml.set_shots(circuit_sample, shots=k)(p_opt), nq),
+  lambda d, k: sample_counts(qml.set_shots(circuit_sample_interfere, shots=k)(p_opt, d), nq),
+  n_shots,
+)
+print(r'|\tilde{x_s}>:', x_tilde_signed, f'(signs from {n_circ} extra circuits)')
+print('fid:', get_fidelity(x_tilde_signed, x))
+print('x_s:', postprocess(x_tilde_signed))
+print()
+
+# the noise of the small indicator amplitude dominates the decoded x, sample until it is pinned down well enough
+xv_hat_l1, counts_l1 = sample_to_l1(lambda k: sample_counts(qml.set_shots(circuit_sample, shots=k)(p_opt), nq), l1_target)
+print(f'x_q ({counts_l1.sum()} shots for the target L1 err {l1_target}):', xv_hat_l1)
+print('L1 err:', np.abs(xv.flatten() - xv_hat_l1).mean())
+print()
+
+
+''' QMeasure H_A '''
+# the loss from shots: the Pauli terms of H_A are measured group by group, one basis-rotated circuit per QWC group
+H_A = A.conj().T @ (I_(nq) - b @ b.conj().T) @ A    # Eq. 6
+plan = MeasurePlan(*pauli_decompose_cached(H_A), nq)
+print(f'[plan] {plan.n_terms} terms => {plan.n_groups} circuits: {[plan.basis_str(k) for k in range(plan.n_groups)]}')
+
+@qml.qnode(dev)
+def circuit_sample_group(param:ndarray, k:int):
+  global circuit
+  circuit(param)
+  plan.qml_rotations(k)
+  return qml.sample()
+
+group_counts = [sample_counts(circuit_sample_group(p_opt, k), nq) for k in range(plan.n_groups)]
+print(f'loss_q ({n_shots} shots x {plan.n_groups} circuits):', plan.energy(group_counts))
+
+# the same total n_shots split across the groups by their variance (a 10% pilot round learns the variances first)
+alloc = ShotAllocator(plan, budget=n_shots // 10)
+sample_group = lambda k, n: sample_counts(qml.set_shots(circuit_sample_group, shots=n)(p_opt, k), nq)
+alloc.estimate(sample_group)
+alloc.budget = n_shots - alloc.n_used
+loss_q_alloc = alloc.estimate(sample_group)
+print(f'loss_q ({alloc.n_used} shots split as {alloc.allocate().tolist()}):', loss_q_alloc, '± %.2e' % alloc.std)
+print('loss:', plan.exact(circuit_state(p_opt)))
+print()
+
+
+''' QMeasure Shadow '''
+# one set of random-Pauli snapshots (one circuit per distinct basis) reused for the loss, the fidelity and the amplitudes
+@qml.qnode(dev)
+def circuit_sample_basis(param:ndarray, bx:int, bz:int):
+  global circuit
+  circuit(param)
+  qml_basis_rotations(bx, bz, nq)
+  return qml.sample()
+
+shadow = collect(lambda bx, bz, k: qml.set_shots(circuit_sample_basis, shots=k)(p_opt, bx, bz), nq, n_shots)
+fp = LOG_PATH / f'{Path(__file__).stem}_shadow.npz'
+print(f'>> save {shadow.n_snapshots} shadow snapshots ({shadow.nbytes} bytes) to: {fp}')
+shadow.save(fp)
+print('loss_sh:', shadow.energy(*pauli_decompose_cached(H_A)))
+print('fid_sh:', shadow.fidelity(x))
+x_tilde_shadow = shadow.amplitudes().real
+print(r'|\tilde{x_sh}>:', x_tilde_shadow)
+print('x_sh:', postprocess(x_tilde_shadow))
 print()
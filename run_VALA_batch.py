@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+# 批量求解大量小规模线性方程组: 所有方程组 pad 到同一 2^n 维，共用同一 ansatz 结构，在一次向量化计算中同时训练
+
+from typing import List, Tuple
+
+import numpy as np
+from numpy import ndarray
+
+from utils import Am, bv, preprocess_batch, postprocess_batch
+from simulator import Gate, ansatz_original, ansatz_simple, n_params, run_circuit, ansatz_cost, ansatz_grad_adjoint
+from optim import Momentum
+
+
+def train_batch(A:ndarray, b:ndarray, gates:List[Gate], lr:float=1.0, momentum:float=0.92, iters:int=3000, log_every:int=100) -> Tuple[ndarray, ndarray]:
+  '''
+  train all systems from preprocess_batch() simultaneously, system i owns the param row p[i]
+    A: [M, N, N], b: [M, N]
+    return: params [M, n_param], losses [iters+1, M]
+  the cost of system i scales with ||A_i||^2, which spans orders of magnitude across a batch,
+  hence its step is preconditioned to lr / ||A_i||^2 so that one lr fits all
+  '''
+  nq = int(np.log2(A.shape[-1]))
+  p = np.zeros([len(A), n_params(gates)])
+  precond = 1 / np.linalg.norm(A, ord=2, axis=(1, 2))**2
+
+  def grad_fn(param:ndarray) -> ndarray:
+    grad_fn.forward, grad = ansatz_grad_adjoint(gates, A, b, param, nq, with_cost=True)
+    return grad * precond[:, None]
+
+  opt = Momentum(stepsize=lr, momentum=momentum)
+  losses = []
+  for i in range(iters):
+    p, loss = opt.step_and_cost(None, p, grad_fn=grad_fn)
+    losses.append(loss)
+    if log_every and i % log_every == 0:
+      print(f'[{i}/{iters}] loss: mean={loss.mean():.4g}, max={loss.max():.4g}')
+  losses.append(ansatz_cost(gates, A, b, p, nq))
+  return p, np.stack(losses)
+
+
+if __name__ == '__main__':
+  from time import time
+
+  ''' HParam '''
+  circ_type = 'original'
+  depth = 1
+  n_systems = 1000
+  lr = 1.0
+  iters = 3000
+  seed = 1024
+  np.random.seed(seed)
+
+  ''' Data '''
+  # the Jiuzhang system, plus random 3x3 integer systems with positive integer solutions
+  As: List[ndarray] = [Am]
+  xs: List[ndarray] = [np.asarray([12, 5, 3])]
+  while len(As) < n_systems:
+    A_i = np.random.randint(-9, 10, size=[3, 3])
+    if abs(np.linalg.det(A_i)) < 10: continue
+    As.append(A_i)
+    xs.append(np.random.randint(1, 16, size=[3]))
+  bs = [A_i @ x_i for A_i, x_i in zip(As, xs)]
+  assert np.allclose(bs[0], bv.flatten())
+
+  A, b, ns = preprocess_batch(As, bs)
+  nq = int(np.log2(A.shape[-1]))
+  print('n_systems:', len(A))
+  print('n_qubits:', nq)
+
+  ''' Train '''
+  gates = ansatz_original(nq, depth) if circ_type == 'original' else ansatz_simple()
+  ts = time()
+  p_opt, losses = train_batch(A, b, gates, lr=lr, iters=iters)
+  print(f'>> trained {len(A)} systems in {time() - ts:.3f}s')
+  print('final loss:', losses[-1].mean())
+
+  ''' PMeasure '''
+  x_tilde = run_circuit(gates, p_opt, nq).real
+  x_hats = postprocess_batch(x_tilde, ns)
+  L1_errs = np.asarray([np.abs(x_hat - x_i).mean() for x_hat, x_i in zip(x_hats, xs)])
+  print('x[0]:', x_hats[0])
+  print('L1 err: mean', L1_errs.mean(), ', max', L1_errs.max())
+  print('solved (L1 err < 0.5):', (L1_errs < 0.5).mean())
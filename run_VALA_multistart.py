@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+
+# 多起点并行训练: N 组 (seed, 初始化, 超参) 在进程池中独立训练，取最优
+# the Hamiltonian is matrix-free (see utils.vala_cost), so its data is just (A, b), shared with workers via shared memory
+
+import os
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from numpy import ndarray
+
+from utils import LOG_PATH, preprocess
+from simulator import ansatz_original, ansatz_simple, n_params, ansatz_cost, ansatz_grad_adjoint
+from optim import Momentum, Rotosolve
+from trainer import Trainer
+
+Config = Dict[str, Any]
+Result = Dict[str, Any]
+
+DEFAULT_CONFIG: Config = {
+  'seed': 0,
+  'circ_type': 'simple',    # 'simple' or 'original'
+  'depth': 1,
+  'optim_type': 'momentum', # 'momentum' or 'rotosolve'
+  'lr': 1.5,
+  'momentum': 0.92,
+  'iters': 3000,
+  'tol': 1e-12,
+  'patience': 300,
+  'init': 'zeros',          # 'zeros', 'uniform' or 'normal'
+  'init_scale': 1.0,
+}
+
+
+''' Shared Memory '''
+
+_shm: Dict[str, shared_memory.SharedMemory] = {}    # keep the handles alive in each worker
+_shared: Dict[str, ndarray] = {}
+
+def share_arrays(**arrays:ndarray) -> Tuple[Dict[str, shared_memory.SharedMemory], Dict[str, Tuple[str, tuple, str]]]:
+  ''' copy arrays to shared memory blocks, returns the owner handles & the specs for attach_arrays() '''
+  handles, specs = {}, {}
+  for name, arr in arrays.items():
+    arr = np.ascontiguousarray(arr)
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+    handles[name] = shm
+    specs[name] = (shm.name, arr.shape, arr.dtype.str)
+  return handles, specs
+
+def attach_arrays(specs:Dict[str, Tuple[str, tuple, str]]):
+  ''' pool initializer: map the shared blocks as read-only ndarrays, no copy '''
+  for name, (shm_name, shape, dtype) in specs.items():
+    shm = shared_memory.SharedMemory(name=shm_name)
+    arr = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    arr.flags.writeable = False
+    _shm[name] = shm
+    _shared[name] = arr
+
+
+''' Train '''
+
+def init_param(cfg:Config, n_param:int) -> ndarray:
+  rng = np.random.default_rng(cfg['seed'])
+  if cfg['init'] == 'zeros':   return np.zeros([n_param])
+  if cfg['init'] == 'uniform': return rng.uniform(-np.pi, np.pi, size=[n_param]) * cfg['init_scale']
+  if cfg['init'] == 'normal':  return rng.normal(size=[n_param]) * cfg['init_scale']
+  raise ValueError(f'unknown init: {cfg["init"]}')
+
+def train_single(A:ndarray, b:ndarray, cfg:Config) -> Tuple[ndarray, List[float]]:
+  ''' one training run on the native simulator, returns the final params and the loss curve '''
+  cfg = {**DEFAULT_CONFIG, **cfg}
+  nq = int(np.log2(A.shape[-1]))
+  gates = ansatz_original(nq, cfg['depth']) if cfg['circ_type'] == 'original' else ansatz_simple()
+  cost_fn = lambda p: ansatz_cost(gates, A, b, p, nq)
+
+  def grad_fn(p:ndarray) -> ndarray:
+    grad_fn.forward, grad = ansatz_grad_adjoint(gates, A, b, p, nq, with_cost=True)
+    return grad
+
+  if cfg['optim_type'] == 'momentum':
+    opt = Momentum(stepsize=cfg['lr'], momentum=cfg['momentum'])
+  elif cfg['optim_type'] == 'rotosolve':
+    opt = Rotosolve(batched=True)
+
+  trainer = Trainer(opt, cost_fn, grad_fn, iters=cfg['iters'], tol=cfg['tol'], patience=cfg['patience'], log_every=0)
+  p = trainer.fit(init_param(cfg, n_params(gates)))
+  return p, trainer.losses
+
+def _worker(cfg:Config) -> Result:
+  p, losses = train_single(_shared['A'], _shared['b'], cfg)
+  return {'cfg': cfg, 'param': p, 'losses': losses}
+
+def multistart(A:ndarray, b:ndarray, configs:List[Config], n_workers:int=None) -> Tuple[Result, List[Result]]:
+  ''' train every config in a process pool, returns the best run (lowest final loss) and all runs '''
+  handles, specs = share_arrays(A=A, b=b)
+  try:
+    with ProcessPoolExecutor(max_workers=n_workers or os.cpu_count(), initializer=attach_arrays, initargs=(specs,)) as pool:
+      results = list(pool.map(_worker, configs))
+  finally:
+    for shm in handles.values():
+      shm.close()
+      shm.unlink()
+  best = min(results, key=lambda res: res['losses'][-1])
+  return best, results
+
+def make_configs(n_runs:int, seed:int=None, max_draws:int=None, **grid:List[Any]) -> List[Config]:
+  '''
+  up to n_runs distinct configs, every hparam given in grid is drawn at random from its candidates;
+  the keys that take no effect are dropped before comparing (seed & init_scale for zeros init, depth for the simple ansatz),
+  so no two runs train the same thing, a small grid may give fewer than n_runs within max_draws (defaults to 100 * n_runs)
+  '''
+  rng = np.random.default_rng(seed)
+  configs, seen = [], set()
+  for _ in range(max_draws or 100 * n_runs):
+    if len(configs) >= n_runs: break
+    cfg = {'seed': int(rng.integers(2**31))}
+    for key, values in grid.items():
+      cfg[key] = values[rng.integers(len(values))]
+    if cfg.get('init', DEFAULT_CONFIG['init']) == 'zeros':
+      cfg['seed'] = 0
+      cfg.pop('init_scale', None)
+    if cfg.get('circ_type', DEFAULT_CONFIG['circ_type']) == 'simple':
+      cfg.pop('depth', None)
+    key = tuple(sorted(cfg.items()))
+    if key in seen: continue
+    seen.add(key)
+    configs.append(cfg)
+  return configs
+
+
+if __name__ == '__main__':
+  from time import time
+  import matplotlib.pyplot as plt
+  from utils import get_fidelity, postprocess, xv
+  from simulator import run_circuit
+
+  ''' HParam '''
+  n_runs = 64
+  n_workers = os.cpu_count()
+  iters = 1000
+  seed = 1024
+
+  ''' Data '''
+  A, b, x = preprocess()
+
+  ''' Train '''
+  configs = make_configs(
+    n_runs, seed,
+    circ_type=['simple', 'original'],
+    depth=[1, 2],
+    optim_type=['momentum', 'rotosolve'],
+    lr=[0.5, 1.0, 1.5],
+    init=['zeros', 'uniform', 'normal'],
+    init_scale=[0.1, 1.0],
+    iters=[iters],
+  )
+  ts = time()
+  best, results = multistart(A, b, configs, n_workers)
+  print(f'>> {len(configs)} runs on {n_workers} workers in {time() - ts:.3f}s')
+  print('best config:', best['cfg'])
+  print('best loss:', best['losses'][-1])
+  print('best param:', best['param'])
+
+  ''' Plot '''
+  for res in results:
+    plt.semilogy(np.maximum(res['losses'], 1e-20), alpha=0.3)
+  plt.semilogy(np.maximum(best['losses'], 1e-20), 'r', label='best')
+  plt.legend()
+  plt.tight_layout()
+  fp = LOG_PATH / 'run_VALA_multistart.png'
+  print(f'>> save loss curves to: {fp}')
+  plt.savefig(fp, dpi=400)
+
+  ''' PMeasure '''
+  cfg = {**DEFAULT_CONFIG, **best['cfg']}
+  nq = int(np.log2(A.shape[-1]))
+  gates = ansatz_original(nq, cfg['depth']) if cfg['circ_type'] == 'original' else ansatz_simple()
+  state = run_circuit(gates, best['param'], nq)
+  x_tilde = (state * np.exp(-1j * np.angle(state[-1]))).real   # RZ leaves a global phase, fix it by the indicator
+  print('fid:', get_fidelity(x_tilde, x.flatten()))
+  xv_hat = postprocess(x_tilde)
+  print('x:', xv_hat)
+  print('L1 err:', np.abs(xv.flatten() - xv_hat).mean())
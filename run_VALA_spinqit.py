@@ -12,6 +12,7 @@ from spinqit.compiler import get_compiler
 from spinqit.backend import QasmBackend
 
 from utils import preprocess, postprocess, I_, get_fidelity, xv, LOG_PATH
+from cache import ResultCache, result_key
 
 ''' HParam '''
 n_qubits = 2
@@ -61,16 +62,27 @@ elif ansatz == 'wtf':
   circ << (Ry, qv[0], p[2])
 
 ''' Train '''
-optim = GradientDescent(maxiter=iters, learning_rate=lr, tolerance=1e-30, verbose=True)
-vqe = VQE(ham, optim, ansatz=circ, params=np.zeros(param_shape))
-loss_list = vqe.run(mode='spinq', grad_method='param_shift')
-losses = [it.item() for it in loss_list]
-print('optimized params:', vqe.optimized_params)
+cache = ResultCache()
+cache_key = result_key(A, b, solver='spinqit', ansatz=ansatz, lr=lr, iters=iters, seed=seed)
+cached = cache.get(cache_key)
+if cached is not None:
+  print(f'>> load trained result from cache: {cache_key}')
+  p_opt = cached['param']
+  losses = [cached['loss']]
+  x_tilde = cached['state']
+else:
+  optim = GradientDescent(maxiter=iters, learning_rate=lr, tolerance=1e-30, verbose=True)
+  vqe = VQE(ham, optim, ansatz=circ, params=np.zeros(param_shape))
+  loss_list = vqe.run(mode='spinq', grad_method='param_shift')
+  losses = [it.item() for it in loss_list]
+  p_opt = vqe.optimized_params
+  x_tilde = np.asarray([it.real for it in vqe.optimized_result.states])
+print('optimized params:', p_opt)
 
 ''' PMeasure '''
-x_tilde = np.asarray([it.real for it in vqe.optimized_result.states])
 print(r'|\tilde{x}>:', x_tilde)
-print('fid:', get_fidelity(x_tilde, x))
+fid = get_fidelity(x_tilde, x)
+print('fid:', fid)
 xv_hat = postprocess(x_tilde)
 print('x:', xv_hat)
 print('L1 err:', np.abs(xv.flatten() - xv_hat).mean())
@@ -79,7 +91,7 @@ print()
 ''' Export QASM '''
 circ = Circuit()
 qv = circ.allocateQubits(n_qubits)
-p = vqe.optimized_params
+p = p_opt
 circ << (Ry, qv[0], p[0])
 circ << (Ry, qv[1], p[1])
 circ << (CNOT, [qv[0], qv[1]])
@@ -92,3 +104,6 @@ fp = LOG_PATH / f'{Path(__file__).stem}.qasm'
 print(f'>> export QASM to: {fp}')
 with open(fp, 'w', encoding='utf-8') as fh:
   fh.write(qasm)
+
+if cached is None:
+  cache.put(cache_key, p_opt, losses[-1], fid, x_tilde, qasm)
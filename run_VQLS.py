@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+
+# impl [arXiv:1909.05820] Variational Quantum Linear Solver, promoted from ref/tutorial_vqls.py
+# A = Σ_l c_l A_l is given as an LCU, |b> = U_b|0>, the cost is assembled from Hadamard-test coefficients
+#   μ_{l,l',j} = <x|A_l'^† U_b Z_j U_b^† A_l|x>    (Z_{-1} := I, the norm term <x|A_l'^† A_l|x>)
+# - μ_{l',l,j} = conj(μ_{l,l',j}), so only the pairs l <= l' are measured, and the diagonal ones are real (no Im circuit)
+# - pairs with |c_l c_l'| < thresh are dropped
+# - all the circuits of one cost evaluation (and of all param-shifted copies for the gradient) run as one batch:
+#   either as Hadamard-test tapes through qml.execute() on a PennyLane device, or emulated on the statevector
+
+from typing import Callable, List, Tuple, Union
+
+import numpy as np
+from numpy import ndarray
+
+from utils import pauli_lcu, pauli_apply
+from simulator import Gate, n_params, run_circuit
+
+Unitary = Union[ndarray, Callable[[ndarray], ndarray]]    # dense [N, N] or a batched mat-vec psi: [..., N] => [..., N]
+
+
+def apply_unitary(U:Unitary, psi:ndarray) -> ndarray:
+  return psi @ U.T if isinstance(U, ndarray) else U(psi)
+
+def householder_dag(b:ndarray) -> Unitary:
+  '''
+  U_b^† for a state-prep U_b|0> = |b>, as a Householder reflection (up to a global phase)
+    H = I - 2|w><w| / <w|w>, w = b' - e_0, with b' = b * conj(phase(b_0)), so that H|b'> = |0> and H^† = H
+  '''
+  b = np.asarray(b).flatten()
+  b = b / np.linalg.norm(b)
+  phase = b[0] / abs(b[0]) if abs(b[0]) > 1e-12 else 1.0
+  w = b * np.conj(phase)
+  w[0] -= 1.0
+  ww = np.vdot(w, w).real
+  if ww < 1e-24: return lambda psi: psi * np.conj(phase)
+  return lambda psi: (psi - 2 * (psi @ w.conj())[..., None] * w / ww) * np.conj(phase)
+
+def lcu_from_matrix(A:ndarray, err:float=1e-8) -> Tuple[ndarray, List[Unitary], ndarray, ndarray]:
+  ''' automatic Pauli LCU of any A [2^n, 2^n] pruned to ||A - A_L||_2 <= err (see utils.pauli_lcu), returns c, unitaries, xs, zs '''
+  nq = int(np.log2(A.shape[0]))
+  xs, zs, c = pauli_lcu(A, err)
+  return c, [pauli_apply(x, z, nq) for x, z in zip(xs.tolist(), zs.tolist())], xs, zs
+
+def make_CA(xs:ndarray, zs:ndarray, nq:int, ancilla:int) -> Callable[[int], None]:
+  '''
+  tutorial-style CA(idx) queuing the ancilla-controlled A_l = P_{x,z} as CNOT/CY/CZ gates, for QNode Hadamard tests
+    X^x Z^z on one qubit with both bits set is -iY, which cancels the i^|x&z| of P_{x,z}, so no phase is left over
+  '''
+  import pennylane as qml
+  ops = {(1, 0): qml.CNOT, (0, 1): qml.CZ, (1, 1): qml.CY}
+  def CA(idx:int):
+    x, z = int(xs[idx]), int(zs[idx])
+    for w in range(nq):
+      key = ((x >> (nq-1-w)) & 1, (z >> (nq-1-w)) & 1)
+      if key in ops: ops[key](wires=[ancilla, w])
+  return CA
+
+def qml_ansatz(gates:List[Gate], param:ndarray):
+  ''' queue the native RY/RZ/CNOT ansatz as PennyLane ops, system wires are the gate wires '''
+  import pennylane as qml
+  for name, wires, pid in gates:
+    if   name == 'RY':   qml.RY(param[pid], wires=wires[0])
+    elif name == 'RZ':   qml.RZ(param[pid], wires=wires[0])
+    elif name == 'CNOT': qml.CNOT(wires=list(wires))
+    else: raise ValueError(f'unsupported gate: {name}')
+
+
+class VQLS:
+
+  '''
+  Hadamard-test VQLS cost for an ansatz of the native simulator
+    c, unitaries: the LCU of A
+    U_b_dag: U_b^†, e.g. householder_dag(b)
+    cost_type: 'local' C_L = 1/2 - 1/(2n) Σ_j Σ c_l c_l'^* μ_{l,l',j} / Σ c_l c_l'^* μ_{l,l',-1}
+               'global' C_G = 1 - Σ c_l c_l'^* μ_{l,l',0-proj} / Σ c_l c_l'^* μ_{l,l',-1}
+    n_shots: None for exact expectations, otherwise each Re/Im Hadamard test is sampled with n_shots
+  two engines for the μ's:
+    dev=None: statevector emulation, μ as inner products of the simulated states, the shots as binomial noise
+    dev: the Hadamard-test circuits are built as tapes with the ancilla on wire nq and run via qml.execute();
+         needs CA (see make_CA(), each A_l hermitian) and U_b queuing the state-prep of |b>,
+         the global |0><0| term is measured as the controlled reflection I - 2|0><0| (qml.FlipSign)
+    note the local cost depends on the whole U_b, not only on |b> = U_b|0>, so it differs between state-preps
+  '''
+
+  def __init__(self, c:ndarray, unitaries:List[Unitary], U_b_dag:Unitary, gates:List[Gate], nq:int=None,
+               cost_type:str='local', thresh:float=1e-8, n_shots:int=None, seed:int=None,
+               dev=None, CA:Callable[[int], None]=None, U_b:Callable[[], None]=None):
+    assert cost_type in ['local', 'global'], f'unknown cost_type: {cost_type}'
+    assert dev is None or (CA is not None and U_b is not None), 'the device engine needs CA and U_b'
+    assert len(c) == len(unitaries)
+    self.c = np.asarray(c)
+    self.unitaries = unitaries
+    self.U_b_dag = U_b_dag
+    self.gates = gates
+    self.nq = nq or max(max(wires) for _, wires, _ in gates) + 1
+    self.cost_type = cost_type
+    self.n_shots = n_shots
+    self.rng = np.random.default_rng(seed)
+    self.dev, self.CA, self.U_b = dev, CA, U_b
+
+    # upper-triangular pairs (l, l') that survive the threshold, off-diagonal ones are weighted twice
+    L = len(self.c)
+    ls, lps = np.triu_indices(L)
+    cc = self.c[ls] * self.c[lps].conj()
+    keep = np.abs(cc) >= thresh
+    self.ls, self.lps = ls[keep], lps[keep]
+    self.weights = cc[keep] * np.where(self.ls == self.lps, 1, 2)
+    self.used = np.unique(np.concatenate([self.ls, self.lps]))    # A_l never paired are not applied at all
+
+    # Z_j signs on the computational basis, qubit j is the j-th most significant bit, [n, N]
+    idx = np.arange(2**self.nq)
+    self.z_signs = np.stack([1 - 2 * ((idx >> (self.nq - 1 - j)) & 1) for j in range(self.nq)]).astype(np.float64)
+
+  @property
+  def n_circuits(self) -> int:
+    ''' Hadamard-test circuits per cost evaluation, Re & Im for off-diagonal pairs, Re only for diagonal ones '''
+    n_j = (self.nq if self.cost_type == 'local' else 1) + 1
+    n_diag = (self.ls == self.lps).sum()
+    return int(n_diag * n_j + (len(self.ls) - n_diag) * n_j * 2)
+
+  def _sample(self, mu:ndarray, real:ndarray) -> ndarray:
+    ''' shot noise of the Hadamard test: <Z_anc> = Re μ (or Im μ with the S^† gate), estimated as 2 * k/n_shots - 1 '''
+    if self.n_shots is None: return mu
+    def est(v:ndarray) -> ndarray:
+      p0 = np.clip((1 + v) / 2, 0.0, 1.0)
+      return 2 * self.rng.binomial(self.n_shots, p0) / self.n_shots - 1
+    re = est(mu.real)
+    im = np.where(real, 0.0, est(mu.imag))
+    return re + 1j * im
+
+  def _mu_statevector(self, param:ndarray) -> Tuple[ndarray, ndarray]:
+    ''' μ_num (averaged over j for the local cost) & μ_norm [P, B] from inner products of the simulated states '''
+    x = run_circuit(self.gates, param, self.nq)     # [B, N]
+
+    ax = {l: apply_unitary(self.unitaries[l], x) for l in self.used}                # A_l|x>
+    y  = {l: apply_unitary(self.U_b_dag, ax[l]) for l in self.used}                 # U_b^† A_l|x>
+    AX  = np.stack([ax[l] for l in self.used])    # [L', B, N]
+    Y   = np.stack([y [l] for l in self.used])
+    pos = {l: i for i, l in enumerate(self.used)}
+    il  = np.asarray([pos[l] for l in self.ls])
+    ilp = np.asarray([pos[l] for l in self.lps])
+    real = (self.ls == self.lps)[:, None]        # [P, 1]
+
+    mu_norm = np.einsum('pbn,pbn->pb', AX[ilp].conj(), AX[il])                                  # [P, B]
+    if self.cost_type == 'local':
+      mu_num = np.einsum('pbn,jn,pbn->pbj', Y[ilp].conj(), self.z_signs, Y[il])                 # [P, B, n]
+      mu_num = self._sample(mu_num, real[:, :, None]).sum(axis=-1) / self.nq
+    else:
+      mu_num = self._sample(Y[ilp, :, 0].conj() * Y[il, :, 0], real)                           # |0><0| projector
+    return mu_num, self._sample(mu_norm, real)
+
+  def _hadamard_test(self, param:ndarray, l:int, lp:int, j:int, imag:bool):
+    '''
+    the tape of Re/Im <x|A_l'^† V_j A_l|x> with V_j = U_b Z_j U_b^† (local), U_b (I - 2|0><0|) U_b^† (global, j = 0)
+    or I (j = -1, the norm term), read out as <Z> of the ancilla
+    '''
+    import pennylane as qml
+    anc = self.nq
+    with qml.queuing.AnnotatedQueue() as q:
+      qml_ansatz(self.gates, param)
+      qml.Hadamard(wires=anc)
+      if imag: qml.adjoint(qml.S(wires=anc))
+      self.CA(l)
+      if j >= 0:
+        qml.adjoint(self.U_b)()
+        if self.cost_type == 'local': qml.CZ(wires=[anc, j])
+        else: qml.ctrl(qml.FlipSign([0] * self.nq, wires=range(self.nq)), control=anc)
+        self.U_b()
+      self.CA(lp)      # A_l'^† = A_l' for Pauli words
+      qml.Hadamard(wires=anc)
+      qml.expval(qml.Z(anc))
+    return qml.tape.QuantumScript.from_queue(q, shots=self.n_shots)
+
+  def _mu_device(self, param:ndarray) -> Tuple[ndarray, ndarray]:
+    ''' μ_num (averaged over j for the local cost) & μ_norm [P, B] from the Hadamard-test tapes, all in one qml.execute() '''
+    import pennylane as qml
+    n_j = self.nq if self.cost_type == 'local' else 1
+    keys, tapes = [], []
+    for b, p in enumerate(param):
+      for k, (l, lp) in enumerate(zip(self.ls.tolist(), self.lps.tolist())):
+        for imag in ([False] if l == lp else [False, True]):
+          for j in range(-1, n_j):
+            keys.append((k, b, j, imag))
+            tapes.append(self._hadamard_test(p, l, lp, j, imag))
+    res = np.asarray(qml.execute(tapes, self.dev, diff_method=None), dtype=np.float64)
+
+    mu = np.zeros([len(self.ls), len(param), n_j + 1], dtype=np.complex128)    # [P, B, j+1]
+    for (k, b, j, imag), v in zip(keys, res):
+      mu[k, b, j + 1] += 1j * v if imag else v
+    mu_norm = mu[:, :, 0]
+    if self.cost_type == 'local': return mu[:, :, 1:].mean(axis=-1), mu_norm
+    return (mu_norm - mu[:, :, 1]) / 2, mu_norm    # <0|..|0> = (<I> - <I - 2|0><0|>) / 2
+
+  def terms(self, param:ndarray) -> Tuple[ndarray, ndarray]:
+    '''
+    the numerator & denominator of the cost fraction, both are expectations of hermitian operators
+      param: [n_param] => (float, float) or batched [B, n_param] => ([B], [B])
+    '''
+    param = np.asarray(param, dtype=np.float64)
+    is_batch = len(param.shape) == 2
+    P = param if is_batch else param[None, :]
+    mu_num, mu_norm = self._mu_statevector(P) if self.dev is None else self._mu_device(P)
+
+    num  = (self.weights[:, None] * mu_num ).sum(axis=0).real
+    norm = (self.weights[:, None] * mu_norm).sum(axis=0).real
+    return (num, norm) if is_batch else (num.item(), norm.item())
+
+  def _cost(self, num:ndarray, norm:ndarray) -> ndarray:
+    if self.cost_type == 'local': return 0.5 - 0.5 * num / norm
+    return 1 - num / norm
+
+  def cost(self, param:ndarray) -> Union[float, ndarray]:
+    return self._cost(*self.terms(param))
+
+  def grad(self, param:ndarray, with_cost:bool=False) -> Union[ndarray, Tuple[float, ndarray]]:
+    '''
+    param-shift on the numerator & denominator separately (both are sinusoidal in each RY/RZ angle), then the quotient rule;
+    the unshifted and all 2*n_param shifted circuits are one batch, so with_cost comes for free
+    '''
+    param = np.asarray(param, dtype=np.float64)
+    P = len(param)
+    shifts = np.concatenate([np.zeros([1, P]), np.eye(P), -np.eye(P)]) * (np.pi / 2)
+    num, norm = self.terms(param[None, :] + shifts)
+    dnum  = (num [1:P+1] - num [P+1:]) / 2
+    dnorm = (norm[1:P+1] - norm[P+1:]) / 2
+    scale = 1.0 if self.cost_type == 'global' else 0.5
+    grad = -scale * (dnum * norm[0] - num[0] * dnorm) / norm[0]**2
+    return (float(self._cost(num[0], norm[0])), grad) if with_cost else grad
+
+
+if __name__ == '__main__':
+  from functools import reduce
+  from utils import preprocess
+  from simulator import ansatz_hea
+  from optim import Momentum
+  from trainer import Trainer
+  import pennylane as qml
+
+  ''' HParam '''
+  problem = 'tutorial'  # 'tutorial' or 'jiuzhang'
+  cost_type = 'local'
+  lcu_err = 1e-8        # error budget of the automatic LCU
+  n_shots = None        # e.g. 10**6 to sample each Hadamard test
+  engine = 'statevector'   # 'statevector' (emulated μ's) or 'pennylane' (Hadamard-test tapes on lightning.qubit, ~30s/step for jiuzhang)
+  iters = 3000
+  seed = 0
+
+  ''' Data '''
+  rng = np.random.default_rng(seed)
+  if problem == 'tutorial':   # A = I + 0.2 X_0 Z_1 + 0.2 X_0, |b> = H^{⊗3}|0>
+    nq = 3
+    I = np.eye(2) ; X = np.asarray([[0, 1], [1, 0]]) ; Z = np.diag([1, -1]) ; H = np.asarray([[1, 1], [1, -1]]) / np.sqrt(2)
+    kron = lambda *ops: reduce(np.kron, ops)
+    c = np.asarray([1.0, 0.2, 0.2])
+    unitaries = [kron(I, I, I), kron(X, Z, I), kron(X, I, I)]
+    U_b = kron(H, H, H)
+    A, b = sum(ci * Ui for ci, Ui in zip(c, unitaries)), U_b[:, 0]
+    U_b_dag = U_b.conj().T
+    xs, zs = np.asarray([0, 0b100, 0b100]), np.asarray([0, 0b010, 0])
+    U_b_ops = lambda: [qml.Hadamard(wires=w) for w in range(nq)]
+    gates = [('RY', (i,), i) for i in range(nq)]    # RY(π/2 + w)|0> = RY(w) H|0>, the tutorial ansatz
+    p_init = np.pi / 2 + 0.001 * rng.normal(size=[n_params(gates)])
+    lr = 0.8
+  else:                       # the padded system of utils.preprocess(), LCU found automatically
+    A, b, _ = preprocess()
+    b = b.flatten()
+    nq = int(np.log2(A.shape[0]))
+    c, unitaries, xs, zs = lcu_from_matrix(A, lcu_err)
+    print(f'>> LCU: {len(c)} of {4**nq} Pauli terms kept within ||A - A_L||_2 <= {lcu_err}')
+    U_b_dag = householder_dag(b)
+    U_b_ops = lambda: qml.MottonenStatePreparation(b, wires=range(nq))
+    gates = ansatz_hea(nq, 1)
+    p_init = np.zeros([n_params(gates)])
+    lr = 0.01     # ||A|x>||^2 in the denominator is ~σmin(A)^2 near the solution, the landscape gets sharp as κ(A) grows
+
+  if engine == 'pennylane':
+    dev = qml.device('lightning.qubit', wires=nq + 1)    # the ancilla is wire nq
+    vqls = VQLS(c, unitaries, U_b_dag, gates, nq, cost_type=cost_type, n_shots=n_shots, dev=dev, CA=make_CA(xs, zs, nq, nq), U_b=U_b_ops)
+  else:
+    vqls = VQLS(c, unitaries, U_b_dag, gates, nq, cost_type=cost_type, n_shots=n_shots, seed=seed)
+  print(f'>> {vqls.n_circuits} Hadamard-test circuits per cost evaluation (vs {2 * len(c)**2 * (nq + 1)} in the tutorial)')
+
+  ''' Train '''
+  def grad_fn(param:ndarray) -> ndarray:
+    grad_fn.forward, grad = vqls.grad(param, with_cost=True)
+    return grad
+
+  trainer = Trainer(Momentum(stepsize=lr, momentum=0.9), vqls.cost, grad_fn, iters=iters, tol=1e-12, log_every=50)
+  p_opt = trainer.fit(p_init)
+
+  ''' PMeasure '''
+  x = np.linalg.solve(A, b)
+  x = x / np.linalg.norm(x)
+  x_tilde = run_circuit(gates, p_opt, nq)
+  print('|x> classical:', x)
+  print('|x> quantum:  ', x_tilde)
+  print('fid:', abs(np.vdot(x, x_tilde))**2)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+# impl [arXiv:2107.08606] Variational Quantum Linear Solver with Dynamic Ansatz
+# start shallow, append one HEA block only when the loss plateaus, keeping the optimized params of earlier blocks
+# NOTE: a new block must NOT start at θ=0: the grown circuit then sits at the previous optimum, which is a stationary
+# point of the deeper circuit as well (zero gradient, PSD Hessian), and the training just stays on the plateau
+
+from typing import List, Tuple
+
+import numpy as np
+from numpy import ndarray
+
+from utils import LOG_PATH, preprocess_batch, postprocess_batch, get_fidelity
+from simulator import ansatz_hea, n_params, run_circuit, ansatz_cost, ansatz_grad_adjoint
+from optim import Momentum
+from trainer import Trainer
+
+
+def train_dynamic(A:ndarray, b:ndarray, max_depth:int=8, lr:float=1.0, momentum:float=0.92, iters:int=3000, tol:float=1e-12,
+                  patience:int=100, init_scale:float=0.3, seed:int=None, log_every:int=0) -> Tuple[ndarray, int, List[float], List[int], bool]:
+  '''
+  train the HEA ansatz from depth 1, grow it by one block whenever the Trainer stops by plateau (or iters)
+    new block params are drawn from N(0, init_scale^2), large enough to leave the stationary point at θ=0 (see above)
+    each depth resumes from the best params seen so far, the step is preconditioned to lr / ||A||^2 as in run_VALA_batch
+    return: final params, final depth, the concatenated loss curve, the loss index where each depth starts, converged by tol
+  '''
+  rng = np.random.default_rng(seed)
+  nq = int(np.log2(A.shape[-1]))
+  precond = 1 / np.linalg.norm(A, ord=2)**2
+  p = np.zeros([0])
+  losses: List[float] = []
+  starts: List[int] = []
+  for depth in range(1, max_depth + 1):
+    gates = ansatz_hea(nq, depth)
+    p = np.concatenate([p, rng.normal(size=[n_params(gates) - len(p)]) * init_scale])
+
+    def grad_fn(param:ndarray) -> ndarray:
+      grad_fn.forward, grad = ansatz_grad_adjoint(gates, A, b, param, nq, with_cost=True)
+      return grad * precond
+
+    cost_fn = lambda param: ansatz_cost(gates, A, b, param, nq)
+    trainer = Trainer(Momentum(stepsize=lr, momentum=momentum), cost_fn, grad_fn, iters=iters, tol=tol, patience=patience, log_every=log_every)
+    trainer.fit(p)
+    p = trainer.params[np.argmin(trainer.losses)]
+    starts.append(len(losses))
+    losses.extend(trainer.losses.tolist())
+    print(f'[depth={depth}] n_param: {len(p)}, steps: {len(trainer.losses)}, stop by {trainer.stop_reason}, best loss: {trainer.losses.min():.4g}')
+    if trainer.stop_reason == 'tol': break
+  converged = trainer.stop_reason == 'tol'
+  if not converged:
+    print(f'>> max_depth={max_depth} reached without convergence, best loss: {min(losses[starts[-1]:]):.4g}')
+  return p, depth, losses, starts, converged
+
+
+if __name__ == '__main__':
+  from pathlib import Path
+  import matplotlib.pyplot as plt
+
+  ''' HParam '''
+  max_depth = 8
+  lr = 1.0
+  iters = 3000
+  tol = 1e-12
+  patience = 100
+  seed = 1024
+
+  ''' Data '''
+  # a random 7x7 integer system on 3 qubits, which needs a few blocks (the 2-qubit Jiuzhang system is solved at depth 1)
+  rng = np.random.default_rng(1)
+  Am = rng.integers(-9, 10, size=[7, 7])
+  xv = rng.integers(1, 16, size=[7])
+  A, b, ns = preprocess_batch([Am], [Am @ xv])
+  A, b = A[0], b[0]
+  x = np.append(xv, 1) / np.linalg.norm(np.append(xv, 1))
+  nq = int(np.log2(A.shape[-1]))
+
+  ''' Train '''
+  p_opt, depth, loss_list, starts, converged = train_dynamic(A, b, max_depth, lr, iters=iters, tol=tol, patience=patience, seed=seed)
+  print(f'final depth: {depth}, converged: {converged}')
+  print(f'final loss: {min(loss_list[starts[-1]:])}')
+  print(f'total steps: {len(loss_list)}')
+  print()
+
+  ''' Plot '''
+  plt.semilogy(np.maximum(loss_list, 1e-20), 'b', alpha=0.75, label='loss')
+  for d, s in enumerate(starts, start=1):
+    plt.axvline(s, color='grey', ls='--', lw=0.5)
+    plt.text(s, 1.0, f' d={d}', transform=plt.gca().get_xaxis_transform(), va='top', fontsize=7, color='grey')
+  plt.legend()
+  plt.tight_layout()
+  fp = LOG_PATH / f'{Path(__file__).stem}.png'
+  print(f'>> save loss curve to: {fp}')
+  plt.savefig(fp, dpi=400)
+  print()
+
+  ''' PMeasure '''
+  x_tilde = run_circuit(ansatz_hea(nq, depth), p_opt, nq).real
+  print(r'|\tilde{x}>:', x_tilde)
+  print('fid:', get_fidelity(x_tilde, x))
+  xv_hat = postprocess_batch(x_tilde[None, :], ns)[0]
+  print('x:', xv_hat)
+  print('L1 err:', np.abs(xv - xv_hat).mean())
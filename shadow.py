@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+# 经典影子 [arXiv:2002.08953]: 一次性采集随机 Pauli 基下的快照数据集，复用来估计 H_A 各项、保真度和各分量振幅
+# each snapshot measures every qubit in a uniformly random basis b_w ∈ {X, Y, Z} and gets bits s_w, then
+#   ρ_s = ⊗_w M_w,  M_w = (I + 3 (-1)^s_w σ_{b_w}) / 2
+# is an unbiased (though unphysical) estimate of ρ, and Tr(O ρ_s) is averaged over snapshots by median-of-means:
+#   Pauli P:    Π_{w ∈ supp P} 3 [b_w = P_w] (-1)^s_w
+#   fidelity:   sqrt(<x|ρ_s|x>) = |<x|ψ>|, the convention of get_fidelity()
+#   amplitude:  ρ[k, r] / sqrt(ρ[r, r]) = x_k, the global phase fixed by a real positive x_r
+
+from pathlib import Path
+from typing import Callable, Tuple
+
+import numpy as np
+from numpy import ndarray
+
+from utils import sample_state, popcount
+from measure import rotate_basis
+
+BASIS_X, BASIS_Y, BASIS_Z = 0, 1, 2     # same recipe codes as qml.classical_shadow()
+PAULIS = np.asarray([
+  [[0, 1], [1, 0]],
+  [[0, -1j], [1j, 0]],
+  [[1, 0], [0, -1]],
+])
+
+SampleFn = Callable[[int, int, int], ndarray]   # (bx, bz, n_shots) => bit samples [n_shots, n] in the basis of the Pauli word (bx, bz)
+
+
+''' Snapshots '''
+
+def median_of_means(values:ndarray, n_groups:int=10) -> ndarray:
+  ''' median over n_groups of the means of contiguous chunks along axis 0 '''
+  return np.median(np.stack([v.mean(axis=0) for v in np.array_split(values, n_groups)]), axis=0)
+
+def basis_word(basis:ndarray, nq:int) -> Tuple[int, int]:
+  ''' a row of basis codes [n] => the packed Pauli word (bx, bz) to rotate into '''
+  bits = 1 << np.arange(nq - 1, -1, -1)
+  basis = np.asarray(basis)
+  return int(bits[basis != BASIS_Z].sum()), int(bits[basis != BASIS_X].sum())
+
+def native_sampler(psi:ndarray, nq:int, rng:np.random.Generator=None) -> SampleFn:
+  ''' SampleFn of a state [2^n] on the native simulator, shots come shuffled like qml.sample() '''
+  rng = rng or np.random.default_rng()
+  def sample_fn(bx:int, bz:int, n_shots:int) -> ndarray:
+    idx = np.repeat(np.arange(2**nq), sample_state(rotate_basis(psi, bx, bz, nq), n_shots, rng))
+    return (rng.permutation(idx)[:, None] >> np.arange(nq - 1, -1, -1)) & 1
+  return sample_fn
+
+def collect(sample_fn:SampleFn, nq:int, n_snapshots:int, rng:np.random.Generator=None) -> 'Shadow':
+  ''' draw random bases for n_snapshots, then run one sampling call per distinct basis with as many shots as it was drawn '''
+  rng = rng or np.random.default_rng()
+  bases = rng.integers(0, 3, size=[n_snapshots, nq], dtype=np.uint8)
+  bits = np.empty_like(bases)
+  codes = bases.astype(np.int64) @ (3 ** np.arange(nq - 1, -1, -1))
+  for code in np.unique(codes):
+    idx = np.flatnonzero(codes == code)
+    bits[idx] = np.asarray(sample_fn(*basis_word(bases[idx[0]], nq), len(idx))).reshape(len(idx), nq)
+  return Shadow(bases, bits)
+
+
+''' Estimators '''
+
+class Shadow:
+
+  '''
+  A reusable set of random-Pauli snapshots, bases & bits are uint8 [S, n];
+  every estimator takes n_groups for the median-of-means, which tames the heavy tails of the 3^|supp| factors
+  '''
+
+  def __init__(self, bases:ndarray, bits:ndarray):
+    assert bases.shape == bits.shape
+    self.bases = np.asarray(bases, dtype=np.uint8)
+    self.bits = np.asarray(bits, dtype=np.uint8)
+
+  @property
+  def n_snapshots(self) -> int:
+    return self.bases.shape[0]
+
+  @property
+  def nq(self) -> int:
+    return self.bases.shape[1]
+
+  @property
+  def nbytes(self) -> int:
+    return self.bases.nbytes + self.bits.nbytes
+
+  def save(self, fp:Path):
+    np.savez_compressed(fp, bases=self.bases, bits=self.bits)
+
+  @classmethod
+  def load(cls, fp:Path) -> 'Shadow':
+    with np.load(fp) as data:
+      return cls(data['bases'], data['bits'])
+
+  def _packed(self, sl:slice) -> Tuple[ndarray, ndarray, ndarray]:
+    ''' the measured Pauli words (bx, bz) and the outcomes r of the snapshots in sl, as packed ints [m] '''
+    w = 1 << np.arange(self.nq - 1, -1, -1)
+    bases = self.bases[sl]
+    return (bases != BASIS_Z) @ w, (bases != BASIS_X) @ w, self.bits[sl].astype(np.int64) @ w
+
+  def _mom(self, fn:Callable[[slice], ndarray], n_groups:int=10, width:int=1, budget:int=2**21) -> ndarray:
+    '''
+    median_of_means() of the per-snapshot values fn(sl) => [m, ...], accumulated chunk by chunk within each group,
+    so the [S, ...] values never exist at once; width is the number of entries fn() makes per snapshot, the chunks
+    hold max(1, budget // width) snapshots
+    '''
+    chunk = max(1, budget // width)
+    means = []
+    for idx in np.array_split(np.arange(self.n_snapshots), n_groups):
+      lo, hi = idx[0], idx[-1] + 1
+      means.append(sum(fn(slice(i, min(i + chunk, hi))).sum(axis=0) for i in range(lo, hi, chunk)) / (hi - lo))
+    return np.median(np.stack(means), axis=0)
+
+  def _pauli_values(self, sl:slice, xs:ndarray, zs:ndarray) -> ndarray:
+    ''' single-snapshot estimates [m, T] of the Pauli terms (packed bitmasks) '''
+    bx, bz, r = self._packed(sl)
+    xs, zs = np.asarray(xs), np.asarray(zs)
+    supp = xs | zs
+    hit = ((bx[:, None] ^ xs) | (bz[:, None] ^ zs)) & supp == 0      # the measured letters agree on the support
+    sign = 1 - 2 * (popcount(r[:, None] & supp) & 1)
+    return hit * (3.0 ** popcount(supp)) * sign
+
+  def expvals(self, xs:ndarray, zs:ndarray, n_groups:int=10) -> ndarray:
+    ''' <P_i> [T] '''
+    return self._mom(lambda sl: self._pauli_values(sl, xs, zs), n_groups, len(xs))
+
+  def energy(self, xs:ndarray, zs:ndarray, coeffs:ndarray, n_groups:int=10) -> float:
+    ''' <H> of H = Σ c_i P_i (real coeffs), the median-of-means is taken over the per-snapshot energies '''
+    return float(self._mom(lambda sl: self._pauli_values(sl, xs, zs) @ coeffs, n_groups, len(xs)))
+
+  def local_ops(self, sl:slice=slice(None)) -> ndarray:
+    ''' the inverted single-qubit snapshots M_w [m, n, 2, 2] of the snapshots in sl '''
+    sign = (1 - 2 * self.bits[sl].astype(np.float64))[..., None, None]
+    return (np.eye(2) + 3 * sign * PAULIS[self.bases[sl]]) / 2
+
+  def _kron_rows(self, vecs:ndarray) -> ndarray:
+    ''' per-snapshot kron of per-qubit vectors [m, n, 2] => [m, 2^n], qubit 0 the most significant '''
+    out = np.ones([len(vecs), 1], dtype=vecs.dtype)
+    for w in range(self.nq):
+      out = (out[:, :, None] * vecs[:, w, None, :]).reshape(len(vecs), -1)
+    return out
+
+  def fidelity(self, x:ndarray, n_groups:int=10) -> float:
+    ''' sqrt(<x|ρ|x>) against a pure state x [2^n], i.e. |<x|ψ>| for a pure ρ, clipped to [0, 1] like utils.get_fidelity() '''
+    x = np.asarray(x).flatten().astype(np.complex128)
+
+    def overlap_sq(sl:slice) -> ndarray:
+      M = self.local_ops(sl)
+      v = np.tile(x, [len(M), 1])
+      for w in range(self.nq):
+        vr = v.reshape(len(M), 2**w, 2, 2**(self.nq-w-1))
+        v = np.einsum('sij,sajb->saib', M[:, w], vr).reshape(len(M), -1)
+      return (v @ x.conj()).real
+
+    return float(np.sqrt(min(1.0, max(0.0, self._mom(overlap_sq, n_groups, 2**self.nq)))))
+
+  def probs(self, n_groups:int=10) -> ndarray:
+    ''' the diagonal of ρ [2^n] '''
+    return self._mom(lambda sl: self._kron_rows(np.diagonal(self.local_ops(sl), axis1=-2, axis2=-1).real), n_groups, 2**self.nq)
+
+  def amplitudes(self, ref:int=None, n_groups:int=10) -> ndarray:
+    '''
+    the amplitudes [2^n] from the column ρ[:, r] of a reference basis state r (defaults to the most probable one),
+    signs and relative phases included, normalized; take .real for real states
+    '''
+    r = int(np.argmax(self.probs(n_groups))) if ref is None else ref
+    r_bits = (r >> np.arange(self.nq - 1, -1, -1)) & 1
+
+    def column(sl:slice) -> ndarray:     # M_w[:, r_w] => ρ_s[:, r], real & imag parts side by side for the median
+      col = self._kron_rows(self.local_ops(sl)[:, np.arange(self.nq), :, r_bits].transpose(1, 0, 2))
+      return np.concatenate([col.real, col.imag], axis=-1)
+
+    v = self._mom(column, n_groups, 2**(self.nq+1))
+    rho_r = v[:2**self.nq] + 1j * v[2**self.nq:]
+    amp = rho_r / np.sqrt(max(rho_r[r].real, 1e-12))
+    return amp / np.linalg.norm(amp)
+
+
+if __name__ == '__main__':
+  from time import time
+  from utils import preprocess, pauli_transform, postprocess, get_fidelity, I_, LOG_PATH
+
+  A, b, x = preprocess()
+  nq = int(np.log2(A.shape[0]))
+  H_A = A.conj().T @ (I_(nq) - b @ b.conj().T) @ A
+  xs, zs, coeffs = pauli_transform(H_A)
+  rng = np.random.default_rng(42)
+
+  # a slightly-off solution, so that the loss & fidelity are non-trivial
+  psi = x.flatten() + 0.05 * rng.normal(size=[2**nq])
+  psi /= np.linalg.norm(psi)
+
+  ts = time()
+  shadow = collect(native_sampler(psi, nq, rng), nq, 100000, rng)
+  print(f'[shadow] {shadow.n_snapshots} snapshots, {shadow.nbytes} bytes, collected in {time() - ts:.3f}s')
+  fp = LOG_PATH / 'shadow.npz'
+  shadow.save(fp)
+  shadow = Shadow.load(fp)
+
+  print(f'  <H_A>: {shadow.energy(xs, zs, coeffs):.6f}, exact: {psi @ H_A @ psi:.6f}')
+  print(f'  fid:   {shadow.fidelity(x):.6f}, exact: {get_fidelity(psi, x):.6f}')
+  amp = shadow.amplitudes().real
+  print(f'  amplitudes: {amp}')
+  print(f'  exact:      {psi}')
+  print(f'  x: {postprocess(amp)}')
+
+  # signs come along: a mixed-sign 3-qubit state
+  nq = 3
+  psi = rng.normal(size=[2**nq])
+  psi /= np.linalg.norm(psi)
+  shadow = collect(native_sampler(psi, nq, rng), nq, 100000, rng)
+  amp = shadow.amplitudes().real
+  print(f'[mixed signs] fid: {get_fidelity(amp, psi):.6f}, signs ok: {np.array_equal(np.sign(amp), np.sign(psi * np.sign(psi[np.argmax(np.abs(psi))])))}')
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+# 纯 numpy 的批量态矢模拟器，专供 run_VALA.py 中的 RY/RZ/CNOT ansatz
+# a batch of param vectors [B, n_param] => a batch of states [B, 2^n] in one go, no QNode construction
+
+from typing import Callable, List, Tuple, Union
+
+import numpy as np
+from numpy import ndarray
+
+from utils import vala_cost, vala_apply
+
+Gate = Tuple[str, Tuple[int, ...], int]    # (name, wires, pid), pid = -1 for non-parametric gates
+
+
+''' Ansatz '''
+
+def ansatz_original(n_qubits:int, depth:int) -> List[Gate]:    # Fig. 1, same as circuit_original() in run_VALA.py
+  gates: List[Gate] = []
+  pid = 0
+  for i in range(n_qubits):
+    gates.append(('RZ', (i,), pid)) ; pid += 1
+    gates.append(('RY', (i,), pid)) ; pid += 1
+  for d in range(depth):
+    for i in range(n_qubits):
+      j = (i + 1) % n_qubits
+      gates.append(('CNOT', (i, j), -1))
+      gates.append(('RZ', (i,), pid)) ; pid += 1
+      gates.append(('RY', (i,), pid)) ; pid += 1
+      gates.append(('RZ', (j,), pid)) ; pid += 1
+      gates.append(('RY', (j,), pid)) ; pid += 1
+  for i in reversed(range(n_qubits)):
+    j = (i + 1) % n_qubits
+    gates.append(('CNOT', (i, j), -1))
+  return gates
+
+def ansatz_simple() -> List[Gate]:    # same as circuit_simple() in run_VALA.py
+  return [
+    ('RY', (0,), 0),
+    ('RY', (1,), 1),
+    ('CNOT', (0, 1), -1),
+    ('RY', (0,), 2),
+  ]
+
+def ansatz_spinqit(name:str) -> List[Gate]:    # the 2-qubit ansatzes of run_VALA_spinqit.py
+  if name == 'wtf': return ansatz_simple()
+  if name == 'swap_distro':
+    return [
+      ('RY', (0,), 0),
+      ('CNOT', (0, 1), -1),
+      ('RY', (0,), 1),
+      ('CNOT', (1, 0), -1),
+      ('RY', (0,), 2),
+    ]
+  if name == 'two_local':
+    return [
+      ('RY', (0,), 0),
+      ('RY', (1,), 1),
+      ('CNOT', (0, 1), -1),
+      ('RY', (0,), 2),
+      ('RY', (1,), 3),
+      ('CNOT', (1, 0), -1),
+      ('RY', (0,), 4),
+      ('RY', (1,), 5),
+    ]
+  raise ValueError(f'unknown ansatz: {name}')
+
+def ansatz_hea(n_qubits:int, depth:int) -> List[Gate]:    # HEA(RY, CNOT, linear) of VQLS-DA [arXiv:2107.08606]
+  '''
+  depth * [RY layer, linear CNOT ladder, RY layer, reversed CNOT ladder]
+  each block is identity at θ=0, so appending a block (with params appended at the end) keeps the state unchanged;
+  but at an optimum of the shallower circuit that point has zero gradient, so a new block should start away from θ=0
+  '''
+  ladder = [('CNOT', (i, i + 1), -1) for i in range(n_qubits - 1)]
+  gates: List[Gate] = []
+  pid = 0
+  for d in range(depth):
+    for i in range(n_qubits):
+      gates.append(('RY', (i,), pid)) ; pid += 1
+    gates.extend(ladder)
+    for i in range(n_qubits):
+      gates.append(('RY', (i,), pid)) ; pid += 1
+    gates.extend(reversed(ladder))
+  return gates
+
+def n_params(gates:List[Gate]) -> int:
+  return max(pid for _, _, pid in gates) + 1
+
+def n_wires(gates:List[Gate]) -> int:
+  return max(max(wires) for _, wires, _ in gates) + 1
+
+def is_real(gates:List[Gate]) -> bool:
+  ''' RY/CNOT only circuits keep the state real, simulate in float64 '''
+  return all(name in ['RY', 'CNOT'] for name, _, _ in gates)
+
+
+''' Gates '''
+# psi: [B, 2^n], updated in-place; qubit w is the w-th most significant bit (same as PennyLane wires)
+# θ: [B]
+
+def apply_ry(psi:ndarray, nq:int, w:int, θ:ndarray):
+  v = psi.reshape(len(psi), 2**w, 2, 2**(nq-w-1))
+  c = np.cos(θ / 2)[:, None, None]
+  s = np.sin(θ / 2)[:, None, None]
+  a0 = v[:, :, 0, :].copy()
+  v[:, :, 0, :] = c * a0 - s * v[:, :, 1, :]
+  v[:, :, 1, :] = s * a0 + c * v[:, :, 1, :]
+
+def apply_rz(psi:ndarray, nq:int, w:int, θ:ndarray):
+  v = psi.reshape(len(psi), 2**w, 2, 2**(nq-w-1))
+  ph = np.exp(0.5j * θ)[:, None, None]
+  v[:, :, 0, :] *= ph.conj()
+  v[:, :, 1, :] *= ph
+
+def apply_cnot(psi:ndarray, nq:int, c:int, t:int):
+  v = psi.reshape([len(psi)] + [2] * nq)
+  idx = [slice(None)] * (nq + 1)
+  idx[1 + c] = 1
+  sub = v[tuple(idx)]                 # view of the control=1 half
+  ax = 1 + (t if t < c else t - 1)    # target axis in the sub view
+  sub[...] = np.flip(sub, axis=ax).copy()
+
+def apply_gate(psi:ndarray, nq:int, gate:Gate, θ:ndarray=None, inverse:bool=False):
+  name, wires, _ = gate
+  if inverse and θ is not None: θ = -θ    # RY(θ)^† = RY(-θ), RZ(θ)^† = RZ(-θ), CNOT^† = CNOT
+  if   name == 'RY':   apply_ry(psi, nq, wires[0], θ)
+  elif name == 'RZ':   apply_rz(psi, nq, wires[0], θ)
+  elif name == 'CNOT': apply_cnot(psi, nq, *wires)
+  else: raise ValueError(f'unsupported gate: {name}')
+
+
+''' Simulate '''
+
+def run_circuit(gates:List[Gate], param:ndarray, nq:int=None) -> ndarray:
+  '''
+  simulate the ansatz from |0...0>
+    param: [n_param] or batched [B, n_param]
+    return: [2^n] or batched [B, 2^n]
+  '''
+  nq = nq or n_wires(gates)
+  param = np.asarray(param, dtype=np.float64)
+  is_batch = len(param.shape) == 2
+  if not is_batch: param = param[None, :]
+
+  psi = np.zeros([len(param), 2**nq], dtype=np.float64 if is_real(gates) else np.complex128)
+  psi[:, 0] = 1.0
+  for gate in gates:
+    pid = gate[-1]
+    apply_gate(psi, nq, gate, param[:, pid] if pid >= 0 else None)
+  return psi if is_batch else psi[0]
+
+def ansatz_cost(gates:List[Gate], A:ndarray, b:ndarray, param:ndarray, nq:int=None) -> Union[float, ndarray]:
+  ''' matrix-free VALA cost <x|H_A|x>, param: [n_param] => float or batched [B, n_param] => [B] '''
+  cost = vala_cost(A, b, run_circuit(gates, param, nq))
+  return cost if len(np.shape(param)) == 2 else cost.item()
+
+def ansatz_grad_param_shift(gates:List[Gate], A:ndarray, b:ndarray, param:ndarray, nq:int=None) -> ndarray:
+  '''
+  exact gradient by the parameter-shift rule, all 2*n_param shifted circuits are simulated as one batch
+    ∂C/∂θ_k = (C(θ + π/2 e_k) - C(θ - π/2 e_k)) / 2, requires each param appears in exactly one RY/RZ
+    param: [n_param] => [n_param] or batched [B, n_param] => [B, n_param]
+  '''
+  param = np.asarray(param, dtype=np.float64)
+  is_batch = len(param.shape) == 2
+  if not is_batch: param = param[None, :]
+
+  B, P = param.shape
+  shifts = np.concatenate([np.eye(P), -np.eye(P)]) * (np.pi / 2)    # [2P, P]
+  params = (param[:, None, :] + shifts[None, :, :]).reshape(B * 2 * P, P)
+  costs = vala_cost(A, b, run_circuit(gates, params, nq)).reshape(B, 2, P)
+  grad = (costs[:, 0] - costs[:, 1]) / 2
+  return grad if is_batch else grad[0]
+
+def ansatz_grad_adjoint(gates:List[Gate], A:ndarray, b:ndarray, param:ndarray, nq:int=None, with_cost:bool=False) -> Union[ndarray, Tuple[ndarray, ndarray]]:
+  '''
+  exact gradient by adjoint differentiation, one forward and one backward sweep regardless of n_param
+    ∂C/∂θ_k = 2 Re <λ_k|∂U_k|φ_{k-1}>, where |λ_k> = U_{k+1}^† ... U_L^† H_A|x>, |φ_{k-1}> = U_{k-1} ... U_1|0>
+    ∂RY(θ)/∂θ = RY(θ+π)/2, ∂RZ(θ)/∂θ = RZ(θ+π)/2
+    param: [n_param] => [n_param] or batched [B, n_param] => [B, n_param]
+    with_cost: also return the cost of the forward pass, which comes for free
+  '''
+  return adjoint_grad(gates, lambda psi: vala_apply(A, b, psi), param, nq, with_cost)
+
+def adjoint_grad(gates:List[Gate], apply_H:Callable[[ndarray], ndarray], param:ndarray, nq:int=None, with_cost:bool=False) -> Union[ndarray, Tuple[ndarray, ndarray]]:
+  ''' ansatz_grad_adjoint() for any hermitian H given as a batched mat-vec apply_H: [B, N] => [B, N] '''
+  nq = nq or n_wires(gates)
+  param = np.asarray(param, dtype=np.float64)
+  is_batch = len(param.shape) == 2
+  if not is_batch: param = param[None, :]
+
+  phi = run_circuit(gates, param, nq)
+  lam = apply_H(phi)
+  cost = (phi.conj() * lam).real.sum(axis=-1)
+  lam = lam.astype(np.result_type(lam, phi))
+  grad = np.zeros_like(param)
+  for gate in reversed(gates):
+    pid = gate[-1]
+    θ = param[:, pid] if pid >= 0 else None
+    apply_gate(phi, nq, gate, θ, inverse=True)
+    if pid >= 0:
+      mu = phi.copy()
+      apply_gate(mu, nq, gate, θ + np.pi)
+      grad[:, pid] += (lam.conj() * mu).real.sum(axis=-1)   # 2 * Re<λ|μ/2>
+    apply_gate(lam, nq, gate, θ, inverse=True)
+
+  if not is_batch: cost, grad = cost.item(), grad[0]
+  return (cost, grad) if with_cost else grad
+
+
+if __name__ == '__main__':
+  from time import time
+  from utils import preprocess, get_fidelity
+
+  A, b, x = preprocess()
+  gates = ansatz_simple()
+
+  # pretrained params of the 'wtf' circuit (see vis_circuit_model.py)
+  p_opt = np.asarray([-0.047208991809220814, 0.7808882554867012, 0.509390326201012])
+  print('cost:', ansatz_cost(gates, A, b, p_opt))
+  print('fid:', get_fidelity(run_circuit(gates, p_opt), x.flatten()))
+
+  # throughput of batched evaluation
+  B = 10000
+  params = np.random.uniform(-np.pi, np.pi, size=[B, n_params(gates)])
+  ts = time()
+  costs = ansatz_cost(gates, A, b, params)
+  print(f'evaluated {B} params in {time() - ts:.3f}s, best cost: {costs.min()}')
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+# 固定 A、流式变化 b 的多右端项求解器
+# H_A = A^†A - A^†|b><b|A, only the rank-one term depends on b:
+#   <x|H_A|x> = <x|A^†A|x> - |<A^†b|x>|^2
+# so everything about A (A^†A, its Pauli form, spectral bounds) is computed once, and each new b costs one A^†|b>
+
+from typing import List, Tuple
+
+import numpy as np
+from numpy import ndarray
+from scipy.sparse import issparse, block_diag, identity
+from scipy.sparse.linalg import eigsh
+
+from utils import pad_system, pad_rhs, pauli_decompose_cached, pauli_transform
+from simulator import Gate, ansatz_original, n_params, run_circuit, adjoint_grad
+from optim import Momentum
+from trainer import Trainer
+
+
+class MultiRHSSolver:
+
+  '''
+  Solve A x = b_k for a fixed A and a stream of b_k, warm-starting each solve from the previous optimum.
+    A: the raw system [n, n], dense or scipy.sparse; it is padded with the scaling indicator (see pad_system())
+  '''
+
+  def __init__(self, A:ndarray, gates:List[Gate]=None, depth:int=1, lr:float=1.0, momentum:float=0.92):
+    self.n = A.shape[0]
+    self.nq = int(np.ceil(np.log2(self.n + 1)))
+    N = 2**self.nq
+    if issparse(A):
+      self.A = block_diag([A, identity(N - self.n)], format='csr')
+    else:
+      self.A, _ = pad_system(A, np.zeros(self.n), N)
+
+    # everything below depends on A alone
+    self.AtA = (self.A.conj().T @ self.A)
+    if issparse(self.AtA): self.AtA = self.AtA.tocsr()
+    self.λmin, self.λmax = self._spectral_bounds()
+    self._pauli_AtA = None
+
+    self.gates = gates or ansatz_original(self.nq, depth)
+    self.lr = lr
+    self.momentum = momentum
+    self.param = np.zeros([n_params(self.gates)])   # warm start for the next solve
+    self.loss = None
+
+  def _spectral_bounds(self) -> Tuple[float, float]:
+    ''' eigen range of A^†A, i.e. σmin(A)^2 and σmax(A)^2 '''
+    if issparse(self.AtA) and self.AtA.shape[0] > 2**12:
+      λmax = eigsh(self.AtA, k=1, which='LA', return_eigenvectors=False).item()
+      λmin = eigsh(self.AtA, k=1, sigma=0, which='LM', return_eigenvectors=False).item()
+    else:
+      evs = np.linalg.eigvalsh(self.AtA.toarray() if issparse(self.AtA) else self.AtA)
+      λmin, λmax = evs[0], evs[-1]
+    return float(λmin), float(λmax)
+
+  @property
+  def condition_number(self) -> float:
+    return np.sqrt(self.λmax / self.λmin)
+
+  @property
+  def pauli_AtA(self) -> Tuple[ndarray, ndarray, ndarray]:
+    ''' cached Pauli form of A^†A, packed as in pauli_transform() '''
+    if self._pauli_AtA is None:
+      AtA = self.AtA.toarray() if issparse(self.AtA) else self.AtA
+      self._pauli_AtA = pauli_decompose_cached(AtA)
+    return self._pauli_AtA
+
+  def rank_one(self, b:ndarray) -> ndarray:
+    ''' the only b-dependent part A^†|b>, with b padded and normalized, [N] '''
+    b_ex = pad_rhs(b, 2**self.nq)
+    b_ex /= np.linalg.norm(b_ex)
+    return self.A.conj().T @ b_ex
+
+  def hamiltonian(self, b:ndarray) -> ndarray:
+    ''' dense H_A = A^†A - A^†|b><b|A '''
+    Atb = self.rank_one(b)
+    AtA = self.AtA.toarray() if issparse(self.AtA) else self.AtA
+    return AtA - np.outer(Atb, Atb.conj())
+
+  def pauli_terms(self, b:ndarray, tol:float=1e-8) -> Tuple[ndarray, ndarray, ndarray]:
+    ''' Pauli form of H_A = cached terms of A^†A + fresh terms of the rank-one part, merged by (x, z) '''
+    Atb = self.rank_one(b)
+    xs0, zs0, cs0 = self.pauli_AtA
+    xs1, zs1, cs1 = pauli_transform(np.outer(Atb, Atb.conj()), tol=0.0)
+    keys = np.concatenate([xs0, xs1]) * 2**self.nq + np.concatenate([zs0, zs1])
+    keys, inv = np.unique(keys, return_inverse=True)
+    coeffs = np.zeros(len(keys), dtype=np.result_type(cs0, cs1))
+    np.add.at(coeffs, inv, np.concatenate([cs0, -cs1]))
+    mask = np.abs(coeffs) > tol
+    return keys[mask] // 2**self.nq, keys[mask] % 2**self.nq, coeffs[mask]
+
+  def solve(self, b:ndarray, iters:int=3000, tol:float=1e-14, warm_start:bool=True) -> ndarray:
+    '''
+    train from the previous optimum (or zeros) on the new b, returns the decoded solution x_hat [n]
+    the step is preconditioned to lr / λmax(A^†A), so one lr fits all scales of A
+    '''
+    Atb = self.rank_one(b)
+
+    def apply_H(psi:ndarray) -> ndarray:    # H_A|x> = A^†A|x> - A^†|b><A^†b|x>
+      return psi @ self.AtA.T - (psi @ Atb.conj())[..., None] * Atb
+
+    def grad_fn(param:ndarray) -> ndarray:
+      grad_fn.forward, grad = adjoint_grad(self.gates, apply_H, param, self.nq, with_cost=True)
+      return grad / self.λmax
+
+    def cost_fn(param:ndarray) -> float:
+      psi = run_circuit(self.gates, param, self.nq)
+      return (psi.conj() * apply_H(psi)).real.sum(axis=-1)
+
+    p = self.param if warm_start else np.zeros_like(self.param)
+    opt = Momentum(stepsize=self.lr, momentum=self.momentum)
+    trainer = Trainer(opt, cost_fn, grad_fn, iters=iters, tol=tol, log_every=0)
+    self.param = trainer.fit(p)
+    self.loss = trainer.losses[-1]
+    return self.decode(self.param)
+
+  def state(self, param:ndarray=None) -> ndarray:
+    return run_circuit(self.gates, self.param if param is None else param, self.nq)
+
+  def decode(self, param:ndarray=None) -> ndarray:
+    x_tilde = self.state(param).real
+    return x_tilde[:self.n] / x_tilde[-1]
+
+
+if __name__ == '__main__':
+  from time import time
+  from utils import Am, xv
+
+  solver = MultiRHSSolver(Am, depth=1)
+  print(f'λ(A^†A): [{solver.λmin:.4g}, {solver.λmax:.4g}], κ(A): {solver.condition_number:.4g}')
+
+  # a stream of right-hand sides drifting around the Jiuzhang one
+  np.random.seed(1024)
+  x = xv.flatten().astype(np.float64)
+  for k in range(10):
+    b = Am @ x
+    ts = time()
+    x_hat = solver.solve(b)
+    print(f'[{k}] loss: {solver.loss:.4g}, L1 err: {np.abs(x_hat - x).mean():.4g}, time: {time() - ts:.3f}s')
+    x = x + np.random.randint(-1, 2, size=x.shape)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+# 通用训练循环: 每步只求一次 cost，收敛即停，可断点续训
+# works with any optimizer exposing step_and_cost(cost_fn, param, grad_fn=...), i.e. qml optimizers and optim.py
+
+import os
+import pickle
+from pathlib import Path
+
+import numpy as np
+from numpy import ndarray
+from numpy.lib.format import open_memmap
+
+from optim import CostFn, GradFn
+
+
+class Trainer:
+
+  '''
+  Run opt.step_and_cost() until one of the stopping rules fires:
+    - 'tol':       loss <= tol
+    - 'grad_norm': ||∇C|| <= grad_tol, only when grad_fn is given
+    - 'plateau':   the best loss has not improved by a relative plateau_delta in the last patience steps
+    - 'converged': the optimizer says so (e.g. optim.Rotosolve)
+    - 'iters':     ran out of iterations
+  The cost is evaluated once per step: step_and_cost() returns the cost prior to the step, which is reused
+  from grad_fn.forward when available (adjoint forward pass or qml.grad), so
+    losses[i] is the cost of params[i], and len(losses) == len(params)
+  History lives in arrays preallocated for iters+1 entries; with ckpt_dir they are memory-mapped .npy files
+  (memory stays flat), and the optimizer state (e.g. the momentum accumulator) is checkpointed every ckpt_every
+  steps so that fit(..., resume=True) continues from the last checkpoint.
+  '''
+
+  def __init__(self, opt, cost_fn:CostFn, grad_fn:GradFn=None, iters:int=3000, tol:float=1e-12, grad_tol:float=0.0,
+               patience:int=0, plateau_delta:float=1e-3, log_every:int=100, ckpt_dir:Path=None, ckpt_every:int=100):
+    self.opt = opt
+    self.cost_fn = cost_fn
+    self.iters = iters
+    self.tol = tol
+    self.grad_tol = grad_tol
+    self.patience = patience              # 0 to disable the plateau rule
+    self.plateau_delta = plateau_delta
+    self.log_every = log_every            # 0 to keep silent
+    self.ckpt_dir = Path(ckpt_dir) if ckpt_dir else None
+    self.ckpt_every = ckpt_every
+
+    self.grad_fn = None
+    if grad_fn is not None:
+      def _grad_fn(param:ndarray) -> ndarray:
+        grad = grad_fn(param)
+        _grad_fn.forward = getattr(grad_fn, 'forward', None)
+        self.grad_norm = float(np.linalg.norm(grad))
+        return grad
+      self.grad_fn = _grad_fn
+
+    self.grad_norm: float = None
+    self.stop_reason: str = None
+    self._params: ndarray = None    # [iters+1, n_param]
+    self._losses: ndarray = None    # [iters+1]
+    self._n = 0                     # number of recorded (param, loss) pairs
+
+  @property
+  def params(self) -> ndarray:
+    return self._params[:self._n]
+
+  @property
+  def losses(self) -> ndarray:
+    return self._losses[:self._n]
+
+  @property
+  def ckpt_fp(self) -> Path:
+    return self.ckpt_dir / 'ckpt.pkl'
+
+  def _open_history(self, n_param:int, resume:bool):
+    if self.ckpt_dir is None:
+      self._params = np.empty([self.iters + 1, n_param])
+      self._losses = np.empty([self.iters + 1])
+      return
+    self.ckpt_dir.mkdir(parents=True, exist_ok=True)
+    mode = 'r+' if resume else 'w+'
+    self._params = open_memmap(self.ckpt_dir / 'params.npy', mode=mode, dtype=np.float64, shape=(self.iters + 1, n_param))
+    self._losses = open_memmap(self.ckpt_dir / 'losses.npy', mode=mode, dtype=np.float64, shape=(self.iters + 1,))
+
+  def _save_ckpt(self, step:int, param:ndarray):
+    self._params.flush()
+    self._losses.flush()
+    state = {
+      'step': step,
+      'n': self._n,
+      'param': param,
+      'opt': vars(self.opt),
+      'best_loss': self.best_loss,
+      'best_step': self.best_step,
+      'stop_reason': self.stop_reason,
+    }
+    tmp_fp = self.ckpt_fp.with_suffix('.tmp')
+    with open(tmp_fp, 'wb') as fh:
+      pickle.dump(state, fh)
+    os.replace(tmp_fp, self.ckpt_fp)    # atomic, a crash never leaves a broken checkpoint
+
+  def _check_stop(self, step:int, loss:float) -> str:
+    if loss <= self.tol: return 'tol'
+    if self.grad_fn is not None and self.grad_norm is not None and self.grad_norm <= self.grad_tol: return 'grad_norm'
+    if self.patience:
+      if loss < self.best_loss * (1 - self.plateau_delta):
+        self.best_loss, self.best_step = loss, step
+      elif step - self.best_step >= self.patience:
+        return 'plateau'
+    if getattr(self.opt, 'converged', False): return 'converged'
+
+  def fit(self, param:ndarray, resume:bool=False) -> ndarray:
+    ''' train from param (or from the last checkpoint if resume), returns the final params; history in self.params & self.losses '''
+    resume = resume and self.ckpt_dir is not None and self.ckpt_fp.exists()
+    self._open_history(len(param), resume)
+    self.best_loss, self.best_step = np.inf, 0
+    self.stop_reason = None
+
+    p, start = param, 0
+    if resume:
+      with open(self.ckpt_fp, 'rb') as fh:
+        state = pickle.load(fh)
+      vars(self.opt).update(state['opt'])
+      p, start, self._n = state['param'], state['step'], state['n']
+      self.best_loss, self.best_step = state['best_loss'], state['best_step']
+      self.stop_reason = state['stop_reason']
+      if self.log_every: print(f'>> resume from step {start}')
+      if self.stop_reason: return p   # finished run
+    else:
+      self._params[0] = p
+      self._n = 0
+
+    for step in range(start, self.iters):
+      p_new, loss = self.opt.step_and_cost(self.cost_fn, p, grad_fn=self.grad_fn)
+      loss = float(loss)
+      self._losses[step] = loss
+      self._n = step + 1
+      if self.log_every and step % self.log_every == 0:
+        print(f'[{step}/{self.iters}] loss: {loss}')
+
+      reason = self._check_stop(step, loss)
+      if reason:    # keep p, whose loss is known
+        self.stop_reason = reason
+        break
+      p = p_new
+      self._params[step + 1] = p
+      if self.ckpt_dir is not None and (step + 1) % self.ckpt_every == 0:
+        self._save_ckpt(step + 1, p)
+    else:
+      self._losses[self.iters] = float(self.cost_fn(p))
+      self._n = self.iters + 1
+      self.stop_reason = 'iters'
+
+    if self.ckpt_dir is not None: self._save_ckpt(self._n, p)
+    if self.log_every:
+      print(f'[{self._n - 1}/{self.iters}] stop by {self.stop_reason}, loss: {self.losses[-1]}')
+    return p
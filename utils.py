@@ -3,8 +3,9 @@
 # Create Time: 2024/06/14 
 
 import random
+import hashlib
 from pathlib import Path
-from typing import List, Tuple
+from typing import Callable, List, Tuple
 
 import numpy as np
 from numpy import ndarray
@@ -13,6 +14,7 @@ from numpy.linalg import norm, inv, eig, eigvals
 BASE_PATH = Path(__file__).parent
 IMG_PATH = BASE_PATH / 'img' ; IMG_PATH.mkdir(exist_ok=True)
 LOG_PATH = BASE_PATH / 'log' ; LOG_PATH.mkdir(exist_ok=True)
+CACHE_PATH = LOG_PATH / 'cache' ; CACHE_PATH.mkdir(exist_ok=True)
 
 ''' Const '''
 
@@ -155,6 +157,215 @@ def postprocess(x_tilde:ndarray) -> ndarray:
   x_hat = x_hat[:len(xv)]
   return x_hat
 
+def pad_rhs(b:ndarray, N:int) -> ndarray:   # b_ex
+  ''' the b half of pad_system(), without touching any N x N matrix '''
+  b = np.asarray(b).flatten()
+  n = len(b)
+  assert N > n, f'need at least one extra entry for the scaling indicator, got N={N} for n={n}'
+  b_ex = np.zeros([N], dtype=np.result_type(np.float64, b))
+  b_ex[:n] = b
+  b_ex[-1] = 1
+  return b_ex
+
+def pad_system(A:ndarray, b:ndarray, N:int) -> Tuple[ndarray, ndarray]:   # A_ex, b_ex
+  '''
+  pad A x = b of size n to size N > n, without normalization
+    the padding block is identity (with zeros in b), so x stays zero there
+    the last entry is the scaling indicator, fixed to 1 (see preprocess())
+  '''
+  A = np.asarray(A)
+  b_ex = pad_rhs(b, N)
+  n = A.shape[0]
+  A_ex = np.zeros([N, N], dtype=np.result_type(np.float64, A))
+  A_ex[:n, :n] = A
+  A_ex[range(n, N), range(n, N)] = 1
+  return A_ex, b_ex
+
+def preprocess_batch(As:List[ndarray], bs:List[ndarray]) -> Tuple[ndarray, ndarray, List[int]]:  # A, b, ns
+  '''
+  batched preprocess() for arbitrary systems A_i x_i = b_i, possibly of different sizes n_i
+    each system is padded by pad_system() to the shared size N = 2^nq, where N > max(n_i)
+    return: A [M, N, N], b [M, N], ns [M]
+  '''
+  assert len(As) == len(bs), 'As and bs should have the same length'
+  ns = [len(np.asarray(b).flatten()) for b in bs]
+  nq = int(np.ceil(np.log2(max(ns) + 1)))
+  N = 2**nq
+
+  systems = [pad_system(Ai, bi, N) for Ai, bi in zip(As, bs)]
+  A = np.stack([A_ex for A_ex, _ in systems])
+  b = np.stack([b_ex for _, b_ex in systems])
+
+  # normalize
+  b_norm = np.linalg.norm(b, axis=-1)
+  A /= b_norm[:, None, None]
+  b /= b_norm[:, None]
+  return A, b, ns
+
+def postprocess_batch(x_tilde:ndarray, ns:List[int]) -> List[ndarray]:
+  ''' batched postprocess(), x_tilde: [M, N] => [x_hat_i: [n_i]] '''
+  x_hat = x_tilde / x_tilde[:, -1:]
+  return [x_hat[i, :n] for i, n in enumerate(ns)]
+
+
+''' Cost '''
+
+def vala_cost(A:ndarray, b:ndarray, psi:ndarray) -> ndarray:
+  '''
+  matrix-free VALA cost <x|H_A|x> = ||A|x>||^2 - |<b|A|x>|^2, equals to Eq. 6 without building H_A
+    A: dense ndarray or scipy.sparse matrix, cost is O(nnz(A)) per state
+       or a batch of systems [B, N, N] with b [B, N] (see preprocess_batch), one state per system
+    psi: state |x> in shape [N], [N, 1] or batched [B, N]
+  '''
+  if len(psi.shape) == 2 and psi.shape[-1] == 1: psi = psi[:, 0]
+  if len(A.shape) == 3:
+    Ax = np.einsum('bij,bj->bi', A, psi)
+    bAx = (b.conj() * Ax).sum(axis=-1)
+  else:
+    Ax = psi @ A.T                  # A|x>, [N] or [B, N]
+    bAx = Ax @ b.conj().flatten()   # <b|A|x>, [] or [B]
+  return (abs(Ax)**2).sum(axis=-1) - abs(bAx)**2
+
+def vala_apply(A:ndarray, b:ndarray, psi:ndarray) -> ndarray:
+  '''
+  matrix-free H_A|x> = A^†(A|x> - |b><b|A|x>), the backward seed of adjoint differentiation
+    psi: state |x> in shape [N] or batched [B, N], A and b may be batched as in vala_cost()
+  '''
+  if len(A.shape) == 3:
+    Ax = np.einsum('bij,bj->bi', A, psi)
+    r = Ax - (b.conj() * Ax).sum(axis=-1, keepdims=True) * b
+    return np.einsum('bi,bij->bj', r, A.conj())
+  b = b.flatten()
+  Ax = psi @ A.T
+  bAx = Ax @ b.conj()
+  r = Ax - bAx[..., None] * b
+  return r @ A.conj()
+
+
+''' Pauli Decompose '''
+
+def popcount(v:ndarray) -> ndarray:
+  ''' vectorized number of set bits of a non-negative int array '''
+  v = np.asarray(v).copy()
+  cnt = np.zeros_like(v)
+  while v.any():
+    cnt += v & 1
+    v >>= 1
+  return cnt
+
+def fwht(V:ndarray) -> ndarray:
+  ''' in-place (unnormalized) Walsh-Hadamard transform along the last axis [..., 2^n]: V[..., z] <- Σ_c (-1)^(z·c) V[..., c] '''
+  N = V.shape[-1]
+  nq = int(np.log2(N))
+  for k in range(nq):   # butterflies along each bit of c
+    Vr = V.reshape(-1, 2**k, 2, 2**(nq-k-1))
+    lo = Vr[:, :, 0, :].copy()
+    Vr[:, :, 0, :] += Vr[:, :, 1, :]
+    np.subtract(lo, Vr[:, :, 1, :], out=Vr[:, :, 1, :])
+  return V
+
+def pauli_transform(H:ndarray, tol:float=1e-8, chunk:int=None) -> Tuple[ndarray, ndarray, ndarray]:   # xs, zs, coeffs
+  '''
+  fast Pauli decomposition H = Σ c_k P_k in O(n*4^n), the packed bitmask form of qml.pauli_decompose
+    P_{x,z} = i^|x&z| X^x Z^z, bit (n-1-w) of x/z is qubit w (wire 0 is the most significant)
+    Tr(X^x Z^z H) = Σ_c (-1)^(z·c) H[c, c^x], i.e. a Walsh-Hadamard transform over c for every x
+  the rows x are permuted & transformed chunk rows at a time (defaults to ~2^20 entries), so the temporaries stay O(chunk*2^n)
+  terms with |c_k| <= tol are pruned; coeffs are real only if every imaginary part is at rounding level (1e-12 relative),
+  any larger anti-hermitian part of H is kept in complex coeffs
+  '''
+  N = H.shape[0]
+  nq = int(np.log2(N))
+  assert 2**nq == N and H.shape == (N, N), 'H should be square with shape 2^n'
+
+  c = np.arange(N)
+  chunk = chunk or max(1, 2**20 // N)
+  xs, zs, coeffs = [], [], []
+  for x0 in range(0, N, chunk):
+    x = np.arange(x0, min(x0 + chunk, N))
+    V = fwht(np.asarray(H[c[None, :], c[None, :] ^ x[:, None]], dtype=np.complex128))   # V[x, c] = H[c, c^x] => V[x, z]
+    V *= 1j ** (popcount(x[:, None] & c[None, :]) % 4) / N
+    r, z = np.nonzero(np.abs(V) > tol)
+    xs.append(x[r]) ; zs.append(z) ; coeffs.append(V[r, z])
+  xs, zs, coeffs = np.concatenate(xs), np.concatenate(zs), np.concatenate(coeffs)
+
+  if np.abs(coeffs.imag).max(initial=0.0) <= 1e-12 * np.abs(coeffs).max(initial=0.0):
+    coeffs = coeffs.real
+  return xs, zs, coeffs
+
+def pauli_strings(xs:ndarray, zs:ndarray, nq:int) -> List[str]:
+  ''' packed bitmasks => Pauli strings like 'IXYZ', char w is for qubit w '''
+  table = {(0, 0): 'I', (1, 0): 'X', (0, 1): 'Z', (1, 1): 'Y'}
+  return [''.join(table[(x >> (nq-1-w)) & 1, (z >> (nq-1-w)) & 1] for w in range(nq)) for x, z in zip(xs.tolist(), zs.tolist())]
+
+def pauli_lcu(A:ndarray, err:float=1e-8) -> Tuple[ndarray, ndarray, ndarray]:   # xs, zs, coeffs
+  '''
+  Pauli LCU A = Σ_l c_l P_l for any square A (c_l is complex when A is not hermitian), pruned to an error budget:
+  since ||P_l||_2 = 1, dropping a set of terms costs ||A - A_L||_2 <= Σ_dropped |c_l|, so the smallest terms go first
+  while their accumulated |c_l| stays within err
+  '''
+  xs, zs, coeffs = pauli_transform(A, tol=0.0)
+  order = np.argsort(np.abs(coeffs), kind='stable')
+  n_drop = np.searchsorted(np.cumsum(np.abs(coeffs[order])), err, side='right')
+  keep = np.sort(order[n_drop:])
+  return xs[keep], zs[keep], coeffs[keep]
+
+def pauli_apply(x:int, z:int, nq:int) -> Callable[[ndarray], ndarray]:
+  '''
+  batched mat-vec of P_{x,z}: psi [..., 2^n] => [..., 2^n], a permutation with signs, no matrix is built
+    (P|psi>)[r] = i^|x&z| (-1)^|z&(r^x)| psi[r^x]
+  '''
+  src = np.arange(2**nq) ^ x
+  phase = (1j ** (int(popcount(np.asarray(x & z))) % 4)) * (1 - 2 * (popcount(z & src) & 1))
+  if np.isreal(phase).all(): phase = phase.real
+  return lambda psi: psi[..., src] * phase
+
+def pauli_decompose_cached(H:ndarray, tol:float=1e-8) -> Tuple[ndarray, ndarray, ndarray]:   # xs, zs, coeffs
+  ''' pauli_transform() with an on-disk cache keyed by the content of H '''
+  H = np.ascontiguousarray(H)
+  hasher = hashlib.sha1()
+  hasher.update(str((H.shape, H.dtype.str, tol)).encode())
+  hasher.update(H.tobytes())
+  fp = CACHE_PATH / f'pauli-{hasher.hexdigest()}.npz'
+  if fp.exists():
+    with np.load(fp) as data:
+      return data['xs'], data['zs'], data['coeffs']
+  xs, zs, coeffs = pauli_transform(H, tol)
+  np.savez(fp, xs=xs, zs=zs, coeffs=coeffs)
+  return xs, zs, coeffs
+
+
+
+''' Sampling '''
+
+def bits_to_int(bits:ndarray) -> ndarray:
+  ''' bit arrays [..., n] (qubit 0 is the most significant) => basis indexes [...], by a dot against powers of two '''
+  bits = np.asarray(bits)
+  nq = bits.shape[-1]
+  return bits.astype(np.int64) @ (1 << np.arange(nq - 1, -1, -1, dtype=np.int64))
+
+def sample_counts(samples:ndarray, nq:int) -> ndarray:
+  ''' samples [S, n] as returned by qml.sample() => counts [2^n] '''
+  return np.bincount(bits_to_int(samples), minlength=2**nq)
+
+def sample_counts_stream(sampler:Callable[[int], ndarray], n_shots:int, nq:int, chunk:int=10**6) -> ndarray:
+  '''
+  accumulate counts [2^n] chunk by chunk, the full sample matrix never exists
+    sampler: k => bit samples [k, n]
+  '''
+  counts = np.zeros([2**nq], dtype=np.int64)
+  n_done = 0
+  while n_done < n_shots:
+    k = min(chunk, n_shots - n_done)
+    counts += sample_counts(sampler(k), nq)
+    n_done += k
+  return counts
+
+def sample_state(psi:ndarray, n_shots:int, rng:np.random.Generator=None) -> ndarray:
+  ''' counts [2^n] of measuring the state psi in the computational basis n_shots times, drawn as one multinomial '''
+  rng = rng or np.random.default_rng()
+  probs = np.abs(np.asarray(psi).flatten())**2
+  return rng.multinomial(n_shots, probs / probs.sum())
+
 
 if __name__ == '__main__':
   A, b, x = preprocess()